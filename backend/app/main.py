@@ -1,17 +1,77 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
+from starlette.concurrency import run_in_threadpool
 
-from services import crud
-from services.database import Base, engine, get_db
+from services import crud, security, auth_service
+from services.database import Base, async_engine, get_db, get_read_db, pool_stats, ReadSessionLocal
+from services.touch_buffer import touch_buffer
+from services.audit_writer import audit_writer
+from services.janitor import janitor
+from services.log_retention import log_retention
+from services.config import settings
+from services.rate_limit import RateLimitMiddleware
+from services import http_cache
+from services.keyring import keyring
+from services.revocation import revocation_list
+from services.refresh_coalescer import refresh_coalescer
+from services.invalidation_bus import bus, KEY_ROTATED
+from services.fast_json import FastJSONResponse, dumps, trusted_dump, trusted_dump_many
 from models import models, schemas
 
 from services.deps import get_current_user
-from typing import List
+from typing import List, Optional
+import hmac
+import json
 
-from backend.app.services.security import verify_password
+async def _rotate_signing_keys():
+    # rotación programada del key ring (y relectura de claves rotadas por otros workers)
+    while True:
+        await asyncio.sleep(settings.JWT_KEY_CHECK_SECONDS)
+        try:
+            if await run_in_threadpool(keyring.rotate_if_due):
+                bus.publish(KEY_ROTATED, keyring.signing_key().kid)
+        except Exception as e:
+            print(f"[ERROR] rotate_signing_keys - {type(e).__name__}: {e}")
 
-app = FastAPI(title="Auth API (FastAPI + MySQL)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Crear tablas si no existen (si no usas el SQL directamente)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    # create_all no sabe de particiones: acceso_log nueva se particiona desde el mes actual
+    await run_in_threadpool(log_retention.rollover)
+    touch_buffer.start()
+    audit_writer.start()
+    await run_in_threadpool(bus.start)
+    rotation_task = None
+    if keyring is not None:
+        await run_in_threadpool(keyring.rotate_if_due)
+        rotation_task = asyncio.create_task(_rotate_signing_keys())
+    janitor.start()
+    try:
+        yield
+    finally:
+        if rotation_task is not None:
+            rotation_task.cancel()
+        await run_in_threadpool(janitor.stop)
+        # vaciar buffers en segundo plano antes de salir
+        await run_in_threadpool(bus.stop)
+        await run_in_threadpool(audit_writer.stop)
+        await run_in_threadpool(touch_buffer.stop)
+        security.shutdown_hash_executor()
+        await async_engine.dispose()
+
+app = FastAPI(title="Auth API (FastAPI + MySQL)", lifespan=lifespan)
+
+# Admisión por IP / email antes de cualquier consulta o bcrypt.
+# Se registra antes que CORS: el último agregado es el más externo, y así los 429 llevan
+# las cabeceras CORS y el navegador puede leer el Retry-After.
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
 
 # CORS para pruebas (ajusta dominios en producción)
 app.add_middleware(
@@ -20,26 +80,83 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
-# Crear tablas si no existen (si no usas el SQL directamente)
-@app.on_event("startup")
-def on_startup():
-    Base.metadata.create_all(bind=engine)
+@app.exception_handler(security.HashingOverloaded)
+async def hashing_overloaded_handler(request: Request, exc: security.HashingOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
 
 @app.get("/health")
-def health():
+async def health():
     return {"ok": True}
 
+@app.get("/.well-known/jwks.json")
+async def jwks(request: Request):
+    """Claves públicas para verificar access tokens localmente (cacheable por los consumidores)."""
+    body = keyring.jwks() if keyring is not None else {"keys": []}
+    raw = dumps(body)
+    etag = http_cache.make_etag("jwks", raw.decode())
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={settings.JWKS_MAX_AGE_SECONDS}"}
+    if http_cache.etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=raw, media_type="application/json", headers=headers)
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: la BD responde y estado de los pools (para dimensionar contra max_connections)."""
+    from sqlalchemy import text
+
+    async def probe():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    try:
+        # con el pool agotado el checkout esperaría DB_POOL_TIMEOUT: más que el timeout del probe
+        await asyncio.wait_for(probe(), timeout=settings.READY_PROBE_TIMEOUT_SECONDS)
+        ready = True
+    except asyncio.TimeoutError:
+        print(f"[ERROR] /health/ready - la BD no respondió en {settings.READY_PROBE_TIMEOUT_SECONDS}s")
+        ready = False
+    except Exception as e:
+        print(f"[ERROR] /health/ready - {type(e).__name__}: {e}")
+        ready = False
+    body = {"ready": ready, "pools": pool_stats(), "audit": audit_writer.stats()}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+@app.get("/health/hashing")
+async def health_hashing():
+    return security.hash_admission.stats()
+
+@app.get("/health/janitor")
+async def health_janitor():
+    return janitor.stats()
+
+@app.get("/health/refresh")
+async def health_refresh():
+    return refresh_coalescer.stats()
+
+@app.get("/health/invalidation")
+async def health_invalidation():
+    return bus.stats()
+
+@app.get("/health/revocation")
+async def health_revocation():
+    return {"stateless": settings.AUTH_STATELESS, **revocation_list.stats()}
+
 @app.post("/init")
-def initialize_default_data(db: Session = Depends(get_db)):
+async def initialize_default_data(db: AsyncSession = Depends(get_db)):
     """Crea un cliente por defecto si no existe ninguno."""
     from sqlalchemy import select
-    existing = db.execute(select(models.Cliente)).first()
+    existing = (await db.execute(select(models.Cliente))).first()
     if existing:
         return {"message": "Ya existen clientes en la base de datos", "cliente_id": existing[0].id}
 
-    cliente = crud.create_cliente(
+    cliente = await crud.create_cliente(
         db,
         nombre="Cliente por defecto",
         identificador="default-client"
@@ -49,39 +166,74 @@ def initialize_default_data(db: Session = Depends(get_db)):
 # --------- Clientes ---------
 
 @app.post("/clientes", response_model=schemas.ClienteOut)
-def create_cliente(body: schemas.ClienteCreate, db: Session = Depends(get_db)):
-    c = crud.create_cliente(db, nombre=body.nombre, identificador=body.identificador, estado="activo")
+async def create_cliente(body: schemas.ClienteCreate, db: AsyncSession = Depends(get_db)):
+    c = await crud.create_cliente(db, nombre=body.nombre, identificador=body.identificador, estado="activo")
     return c
 
 @app.get("/clientes", response_model=List[schemas.ClienteOut])
-def list_clientes(db: Session = Depends(get_db)):
-    from sqlalchemy import select
-    clientes = db.execute(select(models.Cliente)).scalars().all()
-    return clientes
+async def list_clientes(
+    request: Request,
+    after_id: Optional[int] = Query(None, ge=0, description="Cursor: id del último cliente de la página anterior"),
+    limit: int = Query(settings.CLIENTES_PAGE_SIZE, ge=1, le=settings.CLIENTES_PAGE_MAX),
+    db: AsyncSession = Depends(get_read_db),
+):
+    count, last_id, last_update, next_cursor = await crud.clientes_page_version(db, after_id=after_id, limit=limit)
+    etag = http_cache.make_etag("clientes", after_id, limit, count, last_id, last_update)
+    if http_cache.etag_matches(request, etag):
+        resp = http_cache.not_modified(etag)
+        if next_cursor is not None:
+            resp.headers["X-Next-Cursor"] = str(next_cursor)
+        return resp
+
+    key = http_cache.cache_key("clientes", etag)
+    body = http_cache.response_cache.get(key) if http_cache.response_cache else None
+    if body is None:
+        clientes, next_cursor = await crud.list_clientes_page(db, after_id=after_id, limit=limit)
+        body = dumps(trusted_dump_many(schemas.ClienteOut, clientes))
+        if http_cache.response_cache:
+            http_cache.response_cache.set(key, body)
+    resp = http_cache.json_response(body, etag)
+    if next_cursor is not None:
+        resp.headers["X-Next-Cursor"] = str(next_cursor)
+    return resp
+
+@app.get("/clientes/export")
+async def export_clientes():
+    """Exporta todos los clientes como NDJSON, en streaming y con memoria constante."""
+    async def rows():
+        # sesión propia: debe vivir mientras dure el streaming, no solo el handler
+        async with ReadSessionLocal() as db:
+            async for r in crud.stream_clientes(db):
+                yield json.dumps({"id": r.id, "nombre": r.nombre, "identificador": r.identificador, "estado": r.estado}, ensure_ascii=False) + "\n"
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 # --------- Auth ---------
 
-@app.post("/auth/register", response_model=schemas.UsuarioOut)
-def register(body: schemas.UsuarioCreate, request: Request, db: Session = Depends(get_db)):
+@app.post("/auth/register", response_model=schemas.UsuarioOut, response_class=FastJSONResponse)
+async def register(body: schemas.UsuarioCreate, request: Request, db: AsyncSession = Depends(get_db)):
     print(f"[DEBUG] /auth/register - Starting registration for email: {body.email}")
     print(f"[DEBUG] /auth/register - Password length: {len(body.password)} chars")
 
-    if crud.get_user_by_email(db, body.email):
+    if await crud.get_user_by_email(db, body.email):
         print(f"[DEBUG] /auth/register - Email already registered")
         raise HTTPException(status_code=400, detail="Email ya registrado")
 
     print(f"[DEBUG] /auth/register - Calling register_user_with_auto_client")
     try:
+        # bcrypt en el pool de hashing
+        password_hash = await security.hash_password_async(body.password)
         # Crear usuario con cliente automático
-        user = crud.register_user_with_auto_client(
+        user = await crud.register_user_with_auto_client(
             db,
             nombres=body.nombres,
             apellidos=body.apellidos,
             email=body.email,
             telefono=body.telefono,
-            password=body.password
+            password_hash=password_hash,
         )
         print(f"[DEBUG] /auth/register - User created successfully with ID: {user.id}")
+    except security.HashingOverloaded:
+        raise
     except ValueError as e:
         print(f"[ERROR] /auth/register - ValueError: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -89,57 +241,72 @@ def register(body: schemas.UsuarioCreate, request: Request, db: Session = Depend
         print(f"[ERROR] /auth/register - Unexpected Exception: {type(e).__name__}: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
-    crud.register_access_log(db, usuario_id=user.id, email_intentado=user.email, exito=True, ip=request.client.host if request.client else None, detalle="registro")
+    await crud.register_access_log(db, usuario_id=user.id, email_intentado=user.email, exito=True, ip=request.client.host if request.client else None, detalle="registro")
     print(f"[DEBUG] /auth/register - Registration completed successfully")
-    return user
-
-@app.post("/auth/login", response_model=schemas.TokenPair)
-def login(body: schemas.LoginIn, request: Request, db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, body.email)
-    if not user:
-        crud.register_access_log(db, usuario_id=None, email_intentado=body.email, exito=False, ip=request.client.host if request.client else None, detalle="email no existe")
-        raise HTTPException(status_code=401, detail="Credenciales inválidas")
-    if user.estado != "activo":
-        raise HTTPException(status_code=401, detail=f"Usuario {user.estado}")
-
-    # bloqueo?
-    if crud.check_blocked(db, user.id):
-        raise HTTPException(status_code=423, detail="Usuario bloqueado temporalmente")
-
-    cred = user.credencial
-    if not cred or not verify_password(body.password, cred.password_hash):
-        crud.register_failed_attempt(db, user.id)
-        crud.register_access_log(db, usuario_id=user.id, email_intentado=user.email, exito=False, ip=request.client.host if request.client else None, detalle="password inválido")
-        raise HTTPException(status_code=401, detail="Credenciales inválidas")
-
-    # éxito
-    crud.reset_failed_attempts(db, user.id)
-    ses = crud.create_session(db, user.id, ip=request.client.host if request.client else None, user_agent=request.headers.get("user-agent"))
-    access, refresh = crud.issue_tokens_for_session(db, ses)
-    crud.register_access_log(db, usuario_id=user.id, email_intentado=user.email, exito=True, ip=request.client.host if request.client else None, detalle="login ok")
-    return {"access_token": access, "refresh_token": refresh, "session_id": ses.id, "token_type": "bearer"}
-
-@app.post("/auth/refresh", response_model=schemas.TokenPair)
-def refresh_tokens(body: schemas.RefreshIn, request: Request, db: Session = Depends(get_db)):
-    ses = db.get(models.Sesion, body.session_id)
-    if not ses:
-        raise HTTPException(status_code=401, detail="Sesión no encontrada")
+    return FastJSONResponse(trusted_dump(schemas.UsuarioOut, user))
+
+@app.post("/auth/login", response_model=schemas.TokenPair, response_class=FastJSONResponse)
+async def login(body: schemas.LoginIn, request: Request, db: AsyncSession = Depends(get_db)):
     try:
-        access, new_refresh = crud.rotate_refresh(db, ses, body.refresh_token)
+        tokens = await auth_service.login(
+            db,
+            email=body.email,
+            password=body.password,
+            ip=request.client.host if request.client else None,
+            user_agent=request.headers.get("user-agent"),
+        )
+    except auth_service.LoginError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return FastJSONResponse(tokens)
+
+@app.post("/auth/refresh", response_model=schemas.TokenPair, response_class=FastJSONResponse)
+async def refresh_tokens(body: schemas.RefreshIn, request: Request, db: AsyncSession = Depends(get_db)):
+    async def rotate():
+        ses = await db.get(models.Sesion, body.session_id)
+        if not ses:
+            raise ValueError("Sesión no encontrada")
+        return await crud.rotate_refresh(db, ses, body.refresh_token)
+
+    try:
+        # pedidos simultáneos con el mismo token comparten una sola rotación
+        access, new_refresh = await refresh_coalescer.run(body.session_id, body.refresh_token, rotate)
+    except security.HashingOverloaded:
+        raise
+    except crud.RefreshConflict as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
-    return {"access_token": access, "refresh_token": new_refresh, "session_id": ses.id, "token_type": "bearer"}
+    return FastJSONResponse({"access_token": access, "refresh_token": new_refresh, "session_id": body.session_id, "token_type": "bearer"})
+
+@app.post("/auth/introspect", response_model=schemas.IntrospectOut, response_class=FastJSONResponse)
+async def introspect(body: schemas.IntrospectIn, request: Request, db: AsyncSession = Depends(get_db)):
+    """Validación por lotes para gateways: un SELECT de sesiones y uno de usuarios por lote."""
+    if settings.INTROSPECT_API_KEY:
+        provided = request.headers.get("x-introspect-key", "")
+        if not hmac.compare_digest(provided.encode(), settings.INTROSPECT_API_KEY.encode()):
+            raise HTTPException(status_code=401, detail="Invalid introspection key")
+    results = await auth_service.introspect(db, body.tokens)
+    return FastJSONResponse({"results": results})
 
 @app.post("/auth/logout")
-def logout(body: schemas.RefreshIn, db: Session = Depends(get_db)):
-    ses = db.get(models.Sesion, body.session_id)
+async def logout(body: schemas.RefreshIn, db: AsyncSession = Depends(get_db)):
+    ses = await db.get(models.Sesion, body.session_id)
     if not ses:
         raise HTTPException(status_code=200, detail="ok")  # idempotente
-    crud.revoke_session(db, ses)
+    await crud.revoke_session(db, ses)
     return {"ok": True}
 
 # --------- Perfil ---------
 
-@app.get("/me", response_model=schemas.UsuarioOut)
-def me(current_user: models.Usuario = Depends(get_current_user)):
-    return current_user
+@app.get("/me", response_model=schemas.UsuarioOut, response_class=FastJSONResponse)
+async def me(request: Request, current_user: models.Usuario = Depends(get_current_user)):
+    etag = http_cache.make_etag("me", current_user.id, current_user.updated_at, current_user.estado)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag)
+    key = http_cache.cache_key("me", current_user.id, etag)
+    body = http_cache.response_cache.get(key) if http_cache.response_cache else None
+    if body is None:
+        body = dumps(trusted_dump(schemas.UsuarioOut, current_user))
+        if http_cache.response_cache:
+            http_cache.response_cache.set(key, body)
+    return http_cache.json_response(body, etag)
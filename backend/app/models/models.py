@@ -1,7 +1,8 @@
 from sqlalchemy import (
     Column, Integer, BigInteger, String, Enum, DateTime, TIMESTAMP, Boolean,
-    ForeignKey, LargeBinary, UniqueConstraint, Computed
+    ForeignKey, LargeBinary, UniqueConstraint, Computed, text
 )
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
 
 from backend.app.services.database import Base
@@ -14,6 +15,14 @@ MFAMetodo = ("email_code","sms_code","security_question","security_key","totp")
 OTPMedio = ("email_code","sms_code","totp")
 BloqueoTipo = ("bloqueo","desbloqueo","autodesbloqueo")
 
+# Marcador de versión de fila (ETag): MySQL lo actualiza solo en cada UPDATE
+def _row_version_column():
+    return Column(
+        mysql.TIMESTAMP(fsp=6),
+        nullable=False,
+        server_default=text("CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"),
+    )
+
 class Cliente(Base):
     __tablename__ = "cliente"
     id = Column(BigInteger, primary_key=True, autoincrement=True)
@@ -21,6 +30,7 @@ class Cliente(Base):
     identificador = Column(String(50))
     estado = Column(Enum(*ClienteEstado), default="activo", nullable=False)
     created_at = Column(TIMESTAMP, nullable=False)
+    updated_at = _row_version_column()
 
     usuarios = relationship("Usuario", back_populates="cliente")
 
@@ -36,6 +46,7 @@ class Usuario(Base):
     email_verificado = Column(Boolean, nullable=False, default=False)
     telefono_verificado = Column(Boolean, nullable=False, default=False)
     created_at = Column(TIMESTAMP, nullable=False)
+    updated_at = _row_version_column()
 
     cliente = relationship("Cliente", back_populates="usuarios")
     credencial = relationship("UsuarioCredencial", uselist=False, back_populates="usuario")
@@ -111,24 +122,34 @@ class Sesion(Base):
     rotation_counter = Column(Integer, nullable=False, default=0)
     kid = Column(String(64), nullable=True)
 
-    # MySQL computed stored column
-    activa = Column(Boolean, Computed("IF(cierre IS NULL AND revocada=0, 1, 0)", persisted=True))
+    # MySQL computed stored column: 1 si está activa, NULL si no (el UNIQUE ignora las NULL)
+    activa = Column(Boolean, Computed("IF(cierre IS NULL AND revocada=0, 1, NULL)", persisted=True))
+
+    __table_args__ = (UniqueConstraint("usuario_id", "activa", name="uq_sesion_unica_activa"),)
 
     usuario = relationship("Usuario", back_populates="sesiones")
 
 class RefreshHistorial(Base):
+    # refresh tokens ya rotados; la familia es la sesión (sesion_id)
     __tablename__ = "refresh_historial"
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     sesion_id = Column(String(26), ForeignKey("sesion.id"), nullable=False)
     prev_hash = Column(LargeBinary(255), nullable=False)
     rotado_en = Column(TIMESTAMP, nullable=False)
+    # HMAC-SHA256 del token rotado: permite detectar su reutilización con una búsqueda por índice
+    fingerprint = Column(mysql.BINARY(32), nullable=True, index=True)
+    generacion = Column(Integer, nullable=True)
+    # vencimiento que tenía el token rotado; después de eso la fila ya no sirve y se poda
+    expira_en = Column(DateTime, nullable=True, index=True)
 
 class AccesoLog(Base):
+    # particionada por mes sobre `momento` (ver services/log_retention.py): la PK incluye
+    # la columna de partición y no hay FK hacia usuario (MySQL no las admite en tablas particionadas)
     __tablename__ = "acceso_log"
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    usuario_id = Column(BigInteger, ForeignKey("usuario.id"), nullable=True)
+    usuario_id = Column(BigInteger, nullable=True, index=True)
     email_intentado = Column(String(160), nullable=True)
-    momento = Column(DateTime, nullable=False)
+    momento = Column(DateTime, primary_key=True, nullable=False)
     exito = Column(Boolean, nullable=False)
     ip = Column(String(45), nullable=True)
     detalle = Column(String(255), nullable=True)
@@ -165,3 +186,13 @@ class UsernameRecoveryLog(Base):
     email_enviado_a = Column(String(160), nullable=False)
     ip = Column(String(45), nullable=True)
     enviado_en = Column(TIMESTAMP, nullable=False)
+
+class InvalidacionEvento(Base):
+    # transporte "mysql" del bus de invalidación entre workers
+    __tablename__ = "invalidacion_evento"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    origen = Column(String(120), nullable=False)
+    seq = Column(BigInteger, nullable=False)
+    tipo = Column(String(32), nullable=False)
+    clave = Column(String(64), nullable=False)
+    emitido_en = Column(mysql.DATETIME(fsp=6), nullable=False, index=True)
@@ -1,7 +1,9 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
+from backend.app.services.config import settings
+
 # ----------- Auth / Usuarios -----------
 
 class UsuarioCreate(BaseModel):
@@ -37,6 +39,21 @@ class RefreshIn(BaseModel):
     session_id: str
     refresh_token: str
 
+class IntrospectIn(BaseModel):
+    # el tope va en el esquema: un lote enorme se rechaza (422) antes de parsearlo entero
+    tokens: List[str] = Field(min_length=1, max_length=settings.INTROSPECT_MAX_TOKENS, description="Access tokens a validar (máximo INTROSPECT_MAX_TOKENS)")
+
+class IntrospectResult(BaseModel):
+    active: bool
+    sub: Optional[str] = None
+    sid: Optional[str] = None
+    iat: Optional[int] = None
+    exp: Optional[int] = None
+    error: Optional[str] = None
+
+class IntrospectOut(BaseModel):
+    results: List[IntrospectResult]
+
 # ----------- Otros DTOs mínimos -----------
 
 class ClienteCreate(BaseModel):
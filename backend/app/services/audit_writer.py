@@ -0,0 +1,164 @@
+"""
+Escritor asíncrono (en segundo plano) de eventos de auditoría.
+
+`acceso_log` y `bloqueo_evento` ya no se escriben con un commit propio en el request:
+los eventos van a una cola acotada y un hilo los inserta en lotes con INSERT multi-fila.
+`submit` se llama desde el event loop: con la cola llena espera sin bloquearlo (sondeo con
+`asyncio.sleep`) hasta `AUDIT_ENQUEUE_TIMEOUT_SECONDS` (backpressure acotada) y solo
+entonces descarta el evento, lo cuenta en `dropped` y lo avisa en el log.
+Un lote que falla al insertarse (caída breve de la BD) se reintenta hasta
+`AUDIT_WRITE_RETRIES` veces con backoff exponencial antes de contarse en `failed`.
+"""
+import asyncio
+import queue
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import insert
+
+from .config import settings
+from .database import SessionLocal
+from ..models import models
+
+_TABLES = {
+    "acceso_log": models.AccesoLog,
+    "bloqueo_evento": models.BloqueoEvento,
+}
+
+
+class AuditWriter:
+    def __init__(self, max_queue: int, batch_size: int, flush_interval_seconds: float,
+                 enqueue_timeout_seconds: float, lag_warning_seconds: float,
+                 write_retries: int = 0, retry_backoff_seconds: float = 0.0, session_factory=SessionLocal):
+        self._queue: "queue.Queue[tuple[str, dict, float]]" = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_seconds
+        self.enqueue_timeout = enqueue_timeout_seconds
+        self.lag_warning = lag_warning_seconds
+        self.write_retries = write_retries
+        self.retry_backoff = retry_backoff_seconds
+        self._session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # contadores
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retried = 0
+        self.lagging = 0
+        self.max_lag_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retried": self.retried,
+            "lagging": self.lagging,
+            "max_lag_seconds": round(self.max_lag_seconds, 3),
+        }
+
+    async def submit(self, table: str, row: dict) -> bool:
+        """Encola una fila para `table`. Devuelve False si se descartó por cola llena."""
+        if table not in _TABLES:
+            raise ValueError(f"Tabla de auditoría desconocida: {table}")
+        item = (table, row, time.monotonic())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.enqueue_timeout
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                break
+            except queue.Full:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.dropped += 1
+                    # uno por cada potencia de 2: visible en el log sin inundarlo en plena tormenta
+                    if self.dropped & (self.dropped - 1) == 0:
+                        print(f"[WARN] AuditWriter.submit - cola llena, {self.dropped} eventos descartados")
+                    return False
+                await asyncio.sleep(min(0.005, remaining))
+        self.enqueued += 1
+        return True
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo y escribe todo lo que quede en la cola."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        while self._drain_once():
+            pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._drain_once(block=True)
+
+    def _drain_once(self, block: bool = False) -> int:
+        items = []
+        try:
+            if block:
+                items.append(self._queue.get(timeout=self.flush_interval))
+            while len(items) < self.batch_size:
+                items.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not items:
+            return 0
+        self._write(items)
+        return len(items)
+
+    def _write(self, items):
+        by_table: dict[str, list[dict]] = {}
+        now = time.monotonic()
+        for table, row, enqueued_at in items:
+            by_table.setdefault(table, []).append(row)
+            lag = now - enqueued_at
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+            if lag > self.lag_warning:
+                self.lagging += 1
+        for attempt in range(self.write_retries + 1):
+            db = self._session_factory()
+            try:
+                for table, rows in by_table.items():
+                    db.execute(insert(_TABLES[table]).values(rows))
+                db.commit()
+                self.written += len(items)
+                return
+            except Exception as e:
+                db.rollback()
+                error = e
+            finally:
+                db.close()
+            if attempt < self.write_retries:
+                self.retried += 1
+                print(f"[WARN] AuditWriter._write - {type(error).__name__}: {error}; reintento {attempt + 1}/{self.write_retries}")
+                time.sleep(self.retry_backoff * 2 ** attempt)
+        self.failed += len(items)
+        print(f"[ERROR] AuditWriter._write - {type(error).__name__}: {error}; {len(items)} eventos perdidos")
+
+
+audit_writer = AuditWriter(
+    max_queue=settings.AUDIT_QUEUE_MAX,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval_seconds=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    enqueue_timeout_seconds=settings.AUDIT_ENQUEUE_TIMEOUT_SECONDS,
+    lag_warning_seconds=settings.AUDIT_LAG_WARNING_SECONDS,
+    write_retries=settings.AUDIT_WRITE_RETRIES,
+    retry_backoff_seconds=settings.AUDIT_RETRY_BACKOFF_SECONDS,
+)
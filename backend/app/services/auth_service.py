@@ -0,0 +1,89 @@
+"""
+Flujo de login consolidado.
+
+Antes `/auth/login` encadenaba check_blocked, reset_failed_attempts, create_session,
+issue_tokens_for_session y register_access_log, cada uno con su commit. Aquí un login
+exitoso es: un SELECT (`crud.get_login_credentials`), la verificación bcrypt en el
+pool de hashing y una sola transacción de escritura (`crud.open_login_session`).
+
+`introspect` valida lotes de access tokens para gateways: decodifica todos en una
+pasada y resuelve sesiones y usuarios con un `IN (...)` cada uno, sin escrituras. Lee del
+primario: una réplica atrasada daría por activa una sesión ya revocada.
+"""
+from typing import Optional
+
+import jwt
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, security
+
+
+class LoginError(Exception):
+    """Fallo de login con el status HTTP que debe devolver el endpoint."""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+async def login(db: AsyncSession, *, email: str, password: str, ip: Optional[str], user_agent: Optional[str]) -> dict:
+    creds = await crud.get_login_credentials(db, email)
+    if not creds:
+        await crud.register_access_log(db, usuario_id=None, email_intentado=email, exito=False, ip=ip, detalle="email no existe")
+        raise LoginError(401, "Credenciales inválidas")
+    if creds.estado != "activo":
+        raise LoginError(401, f"Usuario {creds.estado}")
+
+    # bloqueo?
+    if creds.is_blocked(crud._utcnow()):
+        raise LoginError(423, "Usuario bloqueado temporalmente")
+
+    if not creds.password_hash or not await security.verify_password_async(password, creds.password_hash):
+        await crud.register_failed_attempt(db, creds.usuario_id)
+        await crud.register_access_log(db, usuario_id=creds.usuario_id, email_intentado=creds.email, exito=False, ip=ip, detalle="password inválido")
+        raise LoginError(401, "Credenciales inválidas")
+
+    # éxito: una transacción, un commit
+    ses, access, refresh = await crud.open_login_session(db, creds=creds, ip=ip, user_agent=user_agent)
+    return {"access_token": access, "refresh_token": refresh, "session_id": ses.id, "token_type": "bearer"}
+
+
+async def introspect(db: AsyncSession, tokens: list[str]) -> list[dict]:
+    """Un resultado por token (en el mismo orden): `active` y, si lo está, sus claims."""
+    decoded: dict[str, object] = {}
+    for token in dict.fromkeys(tokens):
+        try:
+            payload = security.decode_access_token(token)
+        except jwt.PyJWTError:
+            decoded[token] = "invalid_token"
+            continue
+        if not payload.get("sub") or not payload.get("sid"):
+            decoded[token] = "invalid_claims"
+            continue
+        decoded[token] = payload
+
+    session_ids = {p["sid"] for p in decoded.values() if isinstance(p, dict)}
+    sessions = await crud.get_session_states(db, session_ids)
+    estados = await crud.get_user_estados(db, {s.usuario_id for s in sessions.values()})
+
+    now = crud._utcnow()
+    results = []
+    for token in tokens:
+        payload = decoded[token]
+        if not isinstance(payload, dict):
+            results.append({"active": False, "error": payload})
+            continue
+        ses = sessions.get(payload["sid"])
+        if ses is None or str(ses.usuario_id) != str(payload["sub"]) or not ses.is_active(now):
+            results.append({"active": False, "error": "session_inactive"})
+        elif estados.get(ses.usuario_id) != "activo":
+            results.append({"active": False, "error": "user_inactive"})
+        else:
+            results.append({
+                "active": True,
+                "sub": payload["sub"],
+                "sid": payload["sid"],
+                "iat": payload.get("iat"),
+                "exp": payload.get("exp"),
+            })
+    return results
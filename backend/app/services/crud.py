@@ -1,10 +1,20 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import select, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, update, case, and_, or_, null
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime, timezone, timedelta
-from .security import hash_password, verify_password, hash_refresh_token, verify_refresh_token
-from .security import create_access_token, generate_refresh_token, access_expiry_dt, refresh_expiry_dt
-from typing import Optional, Tuple
-from sqlalchemy.exc import NoResultFound
+from .security import hash_password_async, verify_refresh_token_async, hash_refresh_token, refresh_token_digest
+from .security import create_access_token, generate_refresh_token, refresh_expiry_dt, current_kid
+from .config import settings
+from .session_cache import session_cache
+from .revocation import revocation_list
+from .invalidation_bus import bus, SESSION_REVOKED, USER_UPDATED
+from .touch_buffer import touch_buffer
+from .audit_writer import audit_writer
+from typing import NamedTuple, Optional
+from sqlalchemy.exc import DBAPIError
+import asyncio
+import random
 
 from ..models import models
 
@@ -16,7 +26,7 @@ def _utcnow() -> datetime:
     """
     return datetime.now(timezone.utc).replace(tzinfo=None)
 
-def create_cliente(db: Session, *, nombre: str, identificador: str | None = None, estado: str = "activo") -> models.Cliente:
+async def create_cliente(db: AsyncSession, *, nombre: str, identificador: str | None = None, estado: str = "activo") -> models.Cliente:
     """Crea un cliente y devuelve la instancia.
 
     Esto es útil para crear el registro padre antes de crear usuarios que referencien a él.
@@ -29,14 +39,119 @@ def create_cliente(db: Session, *, nombre: str, identificador: str | None = None
         created_at=now,
     )
     db.add(cliente)
-    db.commit()
-    db.refresh(cliente)
+    await db.commit()
+    await db.refresh(cliente)
     return cliente
 
-def get_user_by_email(db: Session, email: str) -> Optional[models.Usuario]:
-    return db.execute(select(models.Usuario).where(models.Usuario.email == email)).scalar_one_or_none()
+async def list_clientes_page(db: AsyncSession, *, after_id: int | None, limit: int) -> tuple[list[models.Cliente], int | None]:
+    """
+    Página por keyset sobre cliente.id: `WHERE id > after_id ORDER BY id LIMIT n`.
+    Devuelve (clientes, cursor_siguiente); el cursor es None en la última página.
+    """
+    stmt = select(models.Cliente).order_by(models.Cliente.id).limit(limit + 1)
+    if after_id is not None:
+        stmt = stmt.where(models.Cliente.id > after_id)
+    rows = list((await db.execute(stmt)).scalars().all())
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
 
-def register_user_with_auto_client(db: Session, *, nombres: str, apellidos: str, email: str, telefono: str | None, password: str) -> models.Usuario:
+async def clientes_page_version(db: AsyncSession, *, after_id: int | None, limit: int) -> tuple:
+    """
+    Marcador de versión de la página (conteo, último id, max(updated_at)) sin cargar filas
+    completas: basta para calcular el ETag y responder 304. El cuarto elemento es el cursor
+    siguiente, con el mismo criterio que `list_clientes_page` (None si no hay más filas).
+    """
+    page = select(models.Cliente.id, models.Cliente.updated_at).order_by(models.Cliente.id).limit(limit)
+    if after_id is not None:
+        page = page.where(models.Cliente.id > after_id)
+    page = page.subquery()
+    count, last_id, last_update = (await db.execute(select(func.count(), func.max(page.c.id), func.max(page.c.updated_at)))).one()
+    next_cursor = None
+    if count == limit:
+        more = (await db.execute(select(models.Cliente.id).where(models.Cliente.id > last_id).limit(1))).first()
+        next_cursor = last_id if more else None
+    return count, last_id, last_update, next_cursor
+
+async def stream_clientes(db: AsyncSession, *, chunk_size: int = 1000):
+    """Recorre todos los clientes con un cursor del lado del servidor (memoria constante)."""
+    stmt = (
+        select(models.Cliente.id, models.Cliente.nombre, models.Cliente.identificador, models.Cliente.estado)
+        .order_by(models.Cliente.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    result = await db.stream(stmt)
+    async for row in result:
+        yield row
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[models.Usuario]:
+    return (await db.execute(select(models.Usuario).where(models.Usuario.email == email))).scalar_one_or_none()
+
+class LoginCredentials(NamedTuple):
+    """Fila liviana para flujos de autenticación (login, MFA, reset de contraseña)."""
+    usuario_id: int
+    email: str
+    estado: str
+    password_hash: Optional[bytes]
+    intentos_fallidos: Optional[int]   # None si aún no hay fila en usuario_bloqueo
+    bloqueado_hasta: Optional[datetime]
+
+    def is_blocked(self, now: datetime) -> bool:
+        return bool(self.bloqueado_hasta and self.bloqueado_hasta > now)
+
+    @property
+    def has_lockout_state(self) -> bool:
+        return bool(self.intentos_fallidos or self.bloqueado_hasta is not None)
+
+async def get_login_credentials(db: AsyncSession, email: str) -> Optional[LoginCredentials]:
+    """Usuario, hash de contraseña y estado de bloqueo en un solo SELECT con LEFT JOINs (sin entidades ORM)."""
+    row = (await db.execute(
+        select(
+            models.Usuario.id,
+            models.Usuario.email,
+            models.Usuario.estado,
+            models.UsuarioCredencial.password_hash,
+            models.UsuarioBloqueo.intentos_fallidos,
+            models.UsuarioBloqueo.bloqueado_hasta,
+        )
+        .select_from(models.Usuario)
+        .outerjoin(models.UsuarioCredencial, models.UsuarioCredencial.usuario_id == models.Usuario.id)
+        .outerjoin(models.UsuarioBloqueo, models.UsuarioBloqueo.usuario_id == models.Usuario.id)
+        .where(models.Usuario.email == email)
+    )).first()
+    return LoginCredentials(*row) if row is not None else None
+
+class SessionState(NamedTuple):
+    """Columnas de `sesion` necesarias para decidir si un access token sigue activo."""
+    id: str
+    usuario_id: int
+    revocada: bool
+    cierre: Optional[datetime]
+    expira_en: datetime
+
+    def is_active(self, now: datetime) -> bool:
+        return not self.revocada and self.cierre is None and now <= self.expira_en
+
+async def get_session_states(db: AsyncSession, session_ids) -> dict[str, SessionState]:
+    """Estado de varias sesiones con un solo `IN (...)` (sin entidades ORM)."""
+    if not session_ids:
+        return {}
+    S = models.Sesion
+    rows = (await db.execute(
+        select(S.id, S.usuario_id, S.revocada, S.cierre, S.expira_en).where(S.id.in_(list(session_ids)))
+    )).all()
+    return {r.id: SessionState(*r) for r in rows}
+
+async def get_user_estados(db: AsyncSession, usuario_ids) -> dict[int, str]:
+    if not usuario_ids:
+        return {}
+    rows = (await db.execute(
+        select(models.Usuario.id, models.Usuario.estado).where(models.Usuario.id.in_(list(usuario_ids)))
+    )).all()
+    return {int(r.id): r.estado for r in rows}
+
+async def register_user_with_auto_client(db: AsyncSession, *, nombres: str, apellidos: str, email: str, telefono: str | None, password: str | None = None, password_hash: bytes | None = None) -> models.Usuario:
     """
     Registra un nuevo usuario creando automáticamente un cliente asociado.
     El cliente se crea con el nombre completo del usuario.
@@ -45,7 +160,7 @@ def register_user_with_auto_client(db: Session, *, nombres: str, apellidos: str,
 
     # Crear cliente automáticamente con el nombre del usuario
     nombre_completo = f"{nombres} {apellidos}"
-    cliente = create_cliente(
+    cliente = await create_cliente(
         db,
         nombre=nombre_completo,
         identificador=email.split('@')[0],  # Usar parte del email como identificador
@@ -54,25 +169,31 @@ def register_user_with_auto_client(db: Session, *, nombres: str, apellidos: str,
     print(f"[DEBUG] register_user_with_auto_client - Cliente auto-creado con ID: {cliente.id}")
 
     # Crear usuario asociado al cliente
-    user = create_user(
+    user = await create_user(
         db,
         cliente_id=cliente.id,
         nombres=nombres,
         apellidos=apellidos,
         email=email,
         telefono=telefono,
-        password=password
+        password=password,
+        password_hash=password_hash,
     )
 
     print(f"[DEBUG] register_user_with_auto_client - Usuario registrado con ID: {user.id}")
     return user
 
-def create_user(db: Session, *, cliente_id: int, nombres: str, apellidos: str, email: str, telefono: str | None, password: str) -> models.Usuario:
+async def create_user(db: AsyncSession, *, cliente_id: int, nombres: str, apellidos: str, email: str, telefono: str | None, password: str | None = None, password_hash: bytes | None = None) -> models.Usuario:
+    """
+    Crea el usuario y su credencial. Si el llamador ya calculó `password_hash` no se
+    vuelve a hashear; si no, bcrypt corre en el pool de hashing.
+    """
     print(f"[DEBUG] crud.create_user - Starting for email: {email}")
-    print(f"[DEBUG] crud.create_user - Password length: {len(password)} chars")
+    if password_hash is None and password is None:
+        raise ValueError("Se requiere password o password_hash")
 
     # Verificar que el cliente exista antes de intentar insertar el usuario.
-    cliente = db.get(models.Cliente, cliente_id)
+    cliente = await db.get(models.Cliente, cliente_id)
     if cliente is None:
         print(f"[ERROR] crud.create_user - Cliente {cliente_id} not found")
         raise ValueError(f"Cliente con id={cliente_id} no existe. Debe crearlo antes de crear usuarios asociados.")
@@ -91,16 +212,17 @@ def create_user(db: Session, *, cliente_id: int, nombres: str, apellidos: str, e
         created_at=_utcnow(),
     )
     db.add(user)
-    db.flush()  # get user.id
+    await db.flush()  # get user.id
     print(f"[DEBUG] crud.create_user - User created with ID: {user.id}")
 
-    print(f"[DEBUG] crud.create_user - About to hash password")
-    try:
-        password_hash = hash_password(password)
-        print(f"[DEBUG] crud.create_user - Password hashed successfully, length: {len(password_hash)}")
-    except Exception as e:
-        print(f"[ERROR] crud.create_user - Failed to hash password: {type(e).__name__}: {e}")
-        raise
+    if password_hash is None:
+        print(f"[DEBUG] crud.create_user - About to hash password")
+        try:
+            password_hash = await hash_password_async(password)
+            print(f"[DEBUG] crud.create_user - Password hashed successfully, length: {len(password_hash)}")
+        except Exception as e:
+            print(f"[ERROR] crud.create_user - Failed to hash password: {type(e).__name__}: {e}")
+            raise
 
     cred = models.UsuarioCredencial(
         usuario_id=user.id,
@@ -109,95 +231,159 @@ def create_user(db: Session, *, cliente_id: int, nombres: str, apellidos: str, e
     )
     db.add(cred)
     print(f"[DEBUG] crud.create_user - Credential created, about to commit")
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     print(f"[DEBUG] crud.create_user - User creation completed successfully")
     return user
 
-def register_access_log(db: Session, *, usuario_id: int | None, email_intentado: str | None, exito: bool, ip: str | None, detalle: str | None):
-    db.add(models.AccesoLog(
+async def register_access_log(db: AsyncSession, *, usuario_id: int | None, email_intentado: str | None, exito: bool, ip: str | None, detalle: str | None, commit: bool = True):
+    """
+    Registra un evento en acceso_log. Con el escritor de auditoría en marcha solo se encola
+    (se inserta en lote en segundo plano); si no (scripts, CLI) se escribe en línea.
+    `commit=False` deja la fila en la transacción del llamador.
+    """
+    row = dict(
         usuario_id=usuario_id,
         email_intentado=email_intentado,
         momento=_utcnow(),
         exito=exito,
         ip=ip,
         detalle=detalle
-    ))
-    db.commit()
-
-def ensure_bloqueo_row(db: Session, usuario_id: int):
-    row = db.get(models.UsuarioBloqueo, usuario_id)
-    if not row:
-        row = models.UsuarioBloqueo(
-            usuario_id=usuario_id,
-            intentos_fallidos=0,
-            bloqueado_hasta=None,
-            ultimo_intento=None,
-            updated_at=_utcnow(),
-        )
-        db.add(row)
-        db.commit()
-        db.refresh(row)
-    return row
+    )
+    if audit_writer.running:
+        await audit_writer.submit("acceso_log", row)
+        return
+    db.add(models.AccesoLog(**row))
+    if commit:
+        await db.commit()
 
-def check_blocked(db: Session, usuario_id: int) -> bool:
-    row = ensure_bloqueo_row(db, usuario_id)
-    now = _utcnow()
-    if row.bloqueado_hasta and row.bloqueado_hasta > now:
-        return True
-    return False
+def _register_bloqueo_event(db: AsyncSession, pending: list, *, usuario_id: int, tipo: str, motivo: str | None, momento: datetime):
+    """
+    Igual que register_access_log pero para bloqueo_evento; en línea se une al commit del llamador.
+    Con el escritor en marcha la fila va a `pending` y el llamador la encola con
+    `_submit_audit` recién después de su commit: un reintento o un rollback no dejan eventos.
+    """
+    row = dict(usuario_id=usuario_id, tipo=tipo, motivo=motivo, efectuado_por=None, momento=momento)
+    if audit_writer.running:
+        pending.append(("bloqueo_evento", row))
+    else:
+        db.add(models.BloqueoEvento(**row))
+
+async def _submit_audit(pending: list):
+    for table, row in pending:
+        await audit_writer.submit(table, row)
 
-def register_failed_attempt(db: Session, usuario_id: int, max_intentos: int = 4, ventana_min: int = 15):
-    row = ensure_bloqueo_row(db, usuario_id)
+# ----------- Bloqueo por intentos -----------
+# Todo se resuelve con sentencias atómicas en MySQL (sin leer-modificar-escribir desde Python),
+# así los intentos concurrentes no pierden incrementos y solo se registran eventos cuando
+# el estado realmente cambia.
+
+async def register_failed_attempt(db: AsyncSession, usuario_id: int, max_intentos: int = 4, ventana_min: int = 15) -> tuple[int, Optional[datetime]]:
+    """
+    Suma un intento fallido con INSERT ... ON DUPLICATE KEY UPDATE y devuelve
+    (intentos_fallidos, bloqueado_hasta) tras el cambio. Si un bloqueo anterior ya venció,
+    el contador vuelve a empezar. El evento "bloqueo" lo emite solo el intento que llega
+    exactamente a `max_intentos`.
+    """
     now = _utcnow()
-    row.intentos_fallidos += 1
-    row.ultimo_intento = now
-    if row.intentos_fallidos >= max_intentos:
-        row.bloqueado_hasta = now.replace(microsecond=0) + timedelta(minutes=ventana_min)
-        db.add(models.BloqueoEvento(
-            usuario_id=usuario_id,
-            tipo="bloqueo",
-            motivo=f"{max_intentos} intentos fallidos",
-            efectuado_por=None,
-            momento=now
-        ))
-    db.add(row)
-    db.commit()
-
-def reset_failed_attempts(db: Session, usuario_id: int):
-    row = ensure_bloqueo_row(db, usuario_id)
-    row.intentos_fallidos = 0
-    row.bloqueado_hasta = None
-    db.add(models.BloqueoEvento(
+    hasta = now.replace(microsecond=0) + timedelta(minutes=ventana_min)
+    t = models.UsuarioBloqueo.__table__
+    stmt = mysql_insert(t).values(
         usuario_id=usuario_id,
-        tipo="desbloqueo",
-        motivo="login exitoso",
-        efectuado_por=None,
-        momento=_utcnow()
-    ))
-    db.add(row)
-    db.commit()
-
-def create_session(db: Session, usuario_id: int, ip: str | None, user_agent: str | None) -> models.Sesion:
-    # cerrar cualquier sesión activa del usuario si deseas forzar solo una
-    # (ya tenemos constraint en MySQL; aquí hacemos best-effort)
-    active = db.execute(
-        select(models.Sesion).where(models.Sesion.usuario_id==usuario_id, models.Sesion.cierre==None, models.Sesion.revocada==False)
-    ).scalars().all()
-    for s in active:
-        s.revocada = True
-        s.cierre = _utcnow()
-        db.add(s)
-    db.commit()
+        intentos_fallidos=1,
+        bloqueado_hasta=hasta if max_intentos <= 1 else None,
+        ultimo_intento=now,
+        updated_at=now,
+    )
+    vencido = and_(t.c.bloqueado_hasta.is_not(None), t.c.bloqueado_hasta <= now)
+    # MySQL aplica las asignaciones en orden: bloqueado_hasta ya ve el contador nuevo
+    stmt = stmt.on_duplicate_key_update([
+        ("intentos_fallidos", case((vencido, 1), else_=t.c.intentos_fallidos + 1)),
+        ("bloqueado_hasta", case(
+            (t.c.intentos_fallidos < max_intentos, null()),
+            (or_(t.c.bloqueado_hasta.is_(None), t.c.bloqueado_hasta <= now), hasta),
+            else_=t.c.bloqueado_hasta,
+        )),
+        ("ultimo_intento", now),
+        ("updated_at", now),
+    ])
+    await db.execute(stmt)
+    intentos, bloqueado_hasta = (await db.execute(
+        select(t.c.intentos_fallidos, t.c.bloqueado_hasta).where(t.c.usuario_id == usuario_id)
+    )).one()
+    pending = []
+    if intentos == max_intentos:
+        _register_bloqueo_event(db, pending, usuario_id=usuario_id, tipo="bloqueo", motivo=f"{max_intentos} intentos fallidos", momento=now)
+    await db.commit()
+    await _submit_audit(pending)
+    return intentos, bloqueado_hasta
 
-    # ULID-like simple 26 chars (no paquete): timestamp + random
+async def reset_failed_attempts(db: AsyncSession, usuario_id: int, *, commit: bool = True, pending: list | None = None) -> bool:
+    """
+    Limpia contador y bloqueo con un UPDATE condicional (no crea filas).
+    Registra "autodesbloqueo" solo si había un bloqueo (ya vencido) que se levanta.
+    Con `commit=False` el evento encolable va a `pending` (ver `_register_bloqueo_event`).
+    Devuelve True si cambió algo.
+    """
+    own = pending is None
+    if own:
+        pending = []
     now = _utcnow()
-    sid = now.strftime("%Y%m%d%H%M%S%f")[:18]  # 18 chars
-    import secrets, base64
-    sid += base64.urlsafe_b64encode(secrets.token_bytes(6)).decode()[:8]  # total ~26
+    t = models.UsuarioBloqueo.__table__
+    base = update(t).where(t.c.usuario_id == usuario_id)
+    lifted = (await db.execute(
+        base.where(t.c.bloqueado_hasta.is_not(None)).values(intentos_fallidos=0, bloqueado_hasta=None, updated_at=now)
+    )).rowcount
+    cleared = lifted or (await db.execute(
+        base.where(t.c.intentos_fallidos > 0).values(intentos_fallidos=0, updated_at=now)
+    )).rowcount
+    if lifted:
+        _register_bloqueo_event(db, pending, usuario_id=usuario_id, tipo="autodesbloqueo", motivo="login exitoso", momento=now)
+    if commit:
+        await db.commit()
+    if own:
+        await _submit_audit(pending)
+    return bool(cleared)
+
+# ----------- Sesión única activa -----------
+# Revocar las activas y crear la nueva va en la misma transacción: UPDATE por conjunto + INSERT.
+# Dos logins simultáneos del mismo usuario pueden chocar igual (deadlock entre los UPDATE, o el
+# segundo INSERT contra uq_sesion_unica_activa); se reintenta la transacción completa unas
+# pocas veces, y el reintento revoca la sesión que acaba de crear el otro.
 
+_RETRYABLE_MYSQL_ERRORS = (1213, 1205)  # deadlock, lock wait timeout
+
+def _is_retryable_session_error(exc: DBAPIError) -> bool:
+    orig = getattr(exc, "orig", None)
+    code = orig.args[0] if orig is not None and orig.args else None
+    if code == 1062:
+        return "uq_sesion_unica_activa" in str(orig)
+    return code in _RETRYABLE_MYSQL_ERRORS
+
+async def _run_session_txn(db: AsyncSession, work):
+    """Ejecuta `work()` y hace commit; reintenta (acotado, con backoff) ante conflictos de sesión única."""
+    retries = settings.SESSION_TXN_MAX_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            result = await work()
+            await db.commit()
+            return result
+        except DBAPIError as e:
+            await db.rollback()
+            if attempt >= retries or not _is_retryable_session_error(e):
+                raise
+            await asyncio.sleep(random.uniform(0, settings.SESSION_TXN_RETRY_BACKOFF_MS / 1000 * 2 ** attempt))
+
+async def _replace_active_session(db: AsyncSession, usuario_id: int, now: datetime, *, ip: str | None, user_agent: str | None, **fields) -> models.Sesion:
+    # una sola sesión activa: UPDATE por conjunto en vez de SELECT + UPDATE por fila
+    await db.execute(
+        update(models.Sesion)
+        .where(models.Sesion.usuario_id == usuario_id, models.Sesion.cierre.is_(None), models.Sesion.revocada == False)
+        .values(revocada=True, cierre=now)
+        .execution_options(synchronize_session=False)
+    )
     ses = models.Sesion(
-        id=sid,
+        id=_new_session_id(now),
         usuario_id=usuario_id,
         inicio=now,
         ultimo_mov=now,
@@ -206,55 +392,185 @@ def create_session(db: Session, usuario_id: int, ip: str | None, user_agent: str
         user_agent=user_agent,
         revocada=False,
         expira_en=now + timedelta(hours=8),  # absolute session lifetime (ajustable)
+        **fields,
     )
     db.add(ses)
-    db.commit()
-    db.refresh(ses)
+    await db.flush()
     return ses
 
-from datetime import timedelta
+def _after_session_replaced(usuario_id: int, ses: models.Sesion):
+    session_cache.invalidate_user(usuario_id)
+    # el UPDATE en bloque no dice qué sesiones revocó: se revoca por usuario salvo la nueva
+    revocation_list.revoke_user(usuario_id, keep_session_id=ses.id)
+    bus.publish(USER_UPDATED, usuario_id)
+
+async def create_session(db: AsyncSession, usuario_id: int, ip: str | None, user_agent: str | None) -> models.Sesion:
+    """Revoca las sesiones activas del usuario y crea una nueva, atómicamente."""
+    async def work():
+        return await _replace_active_session(db, usuario_id, _utcnow(), ip=ip, user_agent=user_agent)
 
-def issue_tokens_for_session(db: Session, sesion: models.Sesion) -> tuple[str, str]:
-    access = create_access_token(subject=str(sesion.usuario_id), session_id=sesion.id)
+    ses = await _run_session_txn(db, work)
+    _after_session_replaced(usuario_id, ses)
+    await db.refresh(ses)
+    return ses
+
+def _new_session_id(now: datetime) -> str:
+    # ULID-like simple 26 chars (no paquete): timestamp + random
+    sid = now.strftime("%Y%m%d%H%M%S%f")[:18]  # 18 chars
+    import secrets, base64
+    sid += base64.urlsafe_b64encode(secrets.token_bytes(6)).decode()[:8]  # total ~26
+    return sid
+
+async def open_login_session(db: AsyncSession, *, creds: LoginCredentials, ip: str | None, user_agent: str | None) -> tuple[models.Sesion, str, str]:
+    """
+    Parte de escritura de un login exitoso, en una sola transacción y un solo commit:
+    reset del bloqueo (solo si hay algo que resetear), revocación en bloque de sesiones
+    previas, INSERT de la nueva sesión ya con su refresh digest y el registro de auditoría.
+    Devuelve (sesion, access_token, refresh_token).
+    """
+    usuario_id = creds.usuario_id
     refresh_plain = generate_refresh_token()
-    sesion.refresh_hash = hash_refresh_token(refresh_plain)
-    sesion.refresh_expira_en = refresh_expiry_dt()
-    sesion.rotation_counter = (sesion.rotation_counter or 0) + 1
-    db.add(sesion)
-    db.commit()
-    return access, refresh_plain
+    # encoladas, las filas de auditoría no son parte de la transacción: se envían una vez, tras el commit
+    audit_queued = audit_writer.running
+    pending = []
 
-def rotate_refresh(db: Session, sesion: models.Sesion, provided_refresh: str) -> tuple[str, str]:
-    # verifica actual
+    async def work():
+        now = _utcnow()
+        pending.clear()  # lo de un intento que se reintentó no cuenta
+        if creds.has_lockout_state:
+            await reset_failed_attempts(db, usuario_id, commit=False, pending=pending)
+        ses = await _replace_active_session(
+            db, usuario_id, now, ip=ip, user_agent=user_agent,
+            refresh_hash=hash_refresh_token(refresh_plain),
+            refresh_expira_en=refresh_expiry_dt(),
+            rotation_counter=1,
+            kid=current_kid(),
+        )
+        if not audit_queued:
+            await register_access_log(db, usuario_id=usuario_id, email_intentado=creds.email, exito=True, ip=ip, detalle="login ok", commit=False)
+        return ses
+
+    ses = await _run_session_txn(db, work)
+    await _submit_audit(pending)
+    if audit_queued:
+        await register_access_log(db, usuario_id=usuario_id, email_intentado=creds.email, exito=True, ip=ip, detalle="login ok")
+    _after_session_replaced(usuario_id, ses)
+
+    access = create_access_token(subject=str(usuario_id), session_id=ses.id)
+    return ses, access, refresh_plain
+
+class RefreshConflict(ValueError):
+    """El token se acaba de rotar en otro request (ventana de gracia): el cliente debe reintentar con el nuevo."""
+
+def ensure_refresh_usable(sesion: models.Sesion):
+    """Valida el estado de la sesión antes de verificar el refresh (sin tocar el hash)."""
     if not sesion.refresh_hash or not sesion.refresh_expira_en:
         raise ValueError("No refresh en sesión")
-    now = _utcnow()
-    if now > sesion.refresh_expira_en or sesion.revocada or sesion.cierre is not None:
+    if _utcnow() > sesion.refresh_expira_en or sesion.revocada or sesion.cierre is not None:
         raise ValueError("Refresh expirado o sesión revocada")
-    if not verify_refresh_token(provided_refresh, sesion.refresh_hash):
+
+async def rotate_refresh(db: AsyncSession, sesion: models.Sesion, provided_refresh: str) -> tuple[str, str]:
+    # verifica actual
+    ensure_refresh_usable(sesion)
+    now = _utcnow()
+    if not await verify_refresh_token_async(provided_refresh, sesion.refresh_hash):
+        rotated = await find_refresh_family(db, provided_refresh)
+        if rotated is not None:
+            family, rotado_en = rotated
+            if family == sesion.id and now - rotado_en <= timedelta(seconds=settings.REFRESH_GRACE_SECONDS):
+                # otro request (quizá en otro worker) acaba de rotar este mismo token
+                raise RefreshConflict("Refresh recién rotado; reintente con el token vigente")
+            await revoke_refresh_family(db, family)
+            raise ValueError("Refresh reutilizado: sesión revocada")
         raise ValueError("Refresh inválido")
 
-    # rotar y registrar historial
+    new_access = create_access_token(subject=str(sesion.usuario_id), session_id=sesion.id)
+    new_refresh = generate_refresh_token()
+    values = dict(
+        refresh_hash=hash_refresh_token(new_refresh),
+        refresh_expira_en=refresh_expiry_dt(),
+        rotation_counter=(sesion.rotation_counter or 0) + 1,
+        ultimo_mov=now,
+        kid=current_kid(),
+    )
+    # compare-and-swap sobre el hash y el contador que se verificaron: si otro request (en otro
+    # worker, o un reintento fuera de la gracia) ya rotó, el UPDATE no toca la fila y este pierde
+    S = models.Sesion
+    seen_counter = S.rotation_counter.is_(None) if sesion.rotation_counter is None else S.rotation_counter == sesion.rotation_counter
+    swapped = (await db.execute(
+        update(S).where(S.id == sesion.id, S.refresh_hash == sesion.refresh_hash, seen_counter)
+        .values(**values).execution_options(synchronize_session=False)
+    )).rowcount
+    if not swapped:
+        await db.rollback()
+        raise RefreshConflict("Refresh recién rotado; reintente con el token vigente")
+
+    # historial en la misma transacción (la huella del token saliente es lo que se busca al detectar reutilización)
     db.add(models.RefreshHistorial(
         sesion_id=sesion.id,
         prev_hash=sesion.refresh_hash,
         rotado_en=now,
+        fingerprint=refresh_token_digest(provided_refresh),
+        generacion=sesion.rotation_counter,
+        expira_en=sesion.refresh_expira_en,
     ))
-
-    new_access = create_access_token(subject=str(sesion.usuario_id), session_id=sesion.id)
-    new_refresh = generate_refresh_token()
-    sesion.refresh_hash = hash_refresh_token(new_refresh)
-    sesion.refresh_expira_en = refresh_expiry_dt()
-    sesion.rotation_counter = (sesion.rotation_counter or 0) + 1
-    sesion.ultimo_mov = now
-    db.add(sesion)
-    db.commit()
+    await db.commit()
+    for key, value in values.items():
+        set_committed_value(sesion, key, value)
     return new_access, new_refresh
 
-def revoke_session(db: Session, sesion: models.Sesion):
+async def find_refresh_family(db: AsyncSession, refresh_token: str) -> Optional[tuple[str, datetime]]:
+    """(sesión/familia, rotado_en) de un refresh ya rotado, o None. Una búsqueda por índice."""
+    row = (await db.execute(
+        select(models.RefreshHistorial.sesion_id, models.RefreshHistorial.rotado_en)
+        .where(models.RefreshHistorial.fingerprint == refresh_token_digest(refresh_token))
+        .order_by(models.RefreshHistorial.rotado_en.desc())
+        .limit(1)
+    )).first()
+    return (row.sesion_id, row.rotado_en) if row is not None else None
+
+async def revoke_refresh_family(db: AsyncSession, sesion_id: str):
+    """
+    Un refresh rotado volvió a presentarse: alguien más tiene (o tuvo) la cadena.
+    Se revoca la sesión completa, lo que invalida el refresh vigente y sus access tokens.
+    """
+    now = _utcnow()
+    usuario_id = (await db.execute(
+        select(models.Sesion.usuario_id).where(models.Sesion.id == sesion_id)
+    )).scalar_one_or_none()
+    await db.execute(
+        update(models.Sesion)
+        .where(models.Sesion.id == sesion_id)
+        .values(revocada=True, cierre=func.coalesce(models.Sesion.cierre, now), refresh_hash=None, refresh_expira_en=None)
+        .execution_options(synchronize_session=False)
+    )
+    await register_access_log(db, usuario_id=usuario_id, email_intentado=None, exito=False, ip=None,
+                              detalle=f"refresh reutilizado, sesión {sesion_id} revocada", commit=False)
+    await db.commit()
+    session_cache.invalidate(sesion_id)
+    revocation_list.revoke_session(sesion_id)
+    touch_buffer.forget(sesion_id)
+    bus.publish(SESSION_REVOKED, sesion_id)
+
+async def revoke_session(db: AsyncSession, sesion: models.Sesion):
     sesion.revocada = True
     sesion.cierre = _utcnow()
     sesion.refresh_hash = None
     sesion.refresh_expira_en = None
     db.add(sesion)
-    db.commit()
+    await db.commit()
+    session_cache.invalidate(sesion.id)
+    revocation_list.revoke_session(sesion.id)
+    touch_buffer.forget(sesion.id)
+    bus.publish(SESSION_REVOKED, sesion.id)
+
+async def set_user_estado(db: AsyncSession, usuario_id: int, estado: str):
+    """Cambia el estado del usuario e invalida sus sesiones cacheadas (y sus access tokens si deja de estar activo)."""
+    if estado not in models.UserEstado:
+        raise ValueError(f"Estado inválido: {estado}")
+    await db.execute(update(models.Usuario).where(models.Usuario.id == usuario_id).values(estado=estado))
+    await db.commit()
+    session_cache.invalidate_user(usuario_id)
+    if estado != "activo":
+        revocation_list.revoke_user(usuario_id)
+    bus.publish(USER_UPDATED, usuario_id)
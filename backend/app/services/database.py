@@ -1,23 +1,165 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from fastapi import Request
+from sqlalchemy import create_engine, event, Select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from backend.app.services.config import settings
+from backend.app.services.pool_metrics import PoolMetrics, timed_pool_class
 
 
 class Base(DeclarativeBase):
     pass
 
+def _async_url(url: str) -> str:
+    """mysql+pymysql://... -> mysql+aiomysql://... (mismo servidor, driver asíncrono)."""
+    scheme, sep, rest = url.partition("://")
+    if scheme.startswith("mysql"):
+        scheme = "mysql+aiomysql"
+    return scheme + sep + rest
+
+def _pool_kwargs(pool_size: int, max_overflow: int) -> dict:
+    return dict(
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_use_lifo=settings.DB_POOL_USE_LIFO,
+    )
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+replica_pool_metrics = PoolMetrics("replica")
+
+# Engine síncrono: create_all, scripts e hilos de fondo (touch buffer, auditoría)
 engine = create_engine(
     settings.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=3600,
+    poolclass=timed_pool_class(QueuePool, sync_pool_metrics),
+    **_pool_kwargs(settings.DB_SYNC_POOL_SIZE, settings.DB_SYNC_MAX_OVERFLOW),
 )
+sync_pool_metrics.attach(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
+# Engine asíncrono: todos los requests
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or _async_url(settings.DATABASE_URL),
+    poolclass=timed_pool_class(AsyncAdaptedQueuePool, async_pool_metrics),
+    **_pool_kwargs(settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW),
+)
+async_pool_metrics.attach(async_engine.sync_engine)
+
+# Réplica de lectura opcional
+replica_engine = None
+if settings.REPLICA_DATABASE_URL:
+    replica_engine = create_async_engine(
+        _async_url(settings.REPLICA_DATABASE_URL),
+        poolclass=timed_pool_class(AsyncAdaptedQueuePool, replica_pool_metrics),
+        **_pool_kwargs(settings.DB_REPLICA_POOL_SIZE, settings.DB_MAX_OVERFLOW),
+    )
+    replica_pool_metrics.attach(replica_engine.sync_engine)
+
+# ----------- Lecturas en réplica -----------
+# Se usa primario si: no hay réplica, la sesión de BD ya escribió algo (o está en flush),
+# o el cliente escribió hace menos de REPLICA_STICKY_SECONDS (lag de replicación).
+
+class _RecentWrites:
+    """Marcas de "escribió hace poco" por cliente (acotado, por proceso)."""
+    def __init__(self, max_keys: int = 50_000):
+        self.max_keys = max_keys
+        self._data: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mark(self, keys: list[str]):
+        now = time.monotonic()
+        with self._lock:
+            for k in keys:
+                self._data[k] = now
+                self._data.move_to_end(k)
+            while len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+
+    def is_recent(self, keys: list[str], window: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            return any(now - self._data.get(k, -window) < window for k in keys)
+
+recent_writes = _RecentWrites()
+
+def _client_keys(request: Request) -> list[str]:
+    keys = []
+    if request.client:
+        keys.append("ip:" + request.client.host)
+    auth = request.headers.get("Authorization")
+    if auth:
+        keys.append("auth:" + hashlib.sha256(auth.encode("utf-8")).hexdigest()[:32])
+    return keys
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if replica_engine is None or self.info.get("use_primary") or self._flushing or not isinstance(clause, Select):
+            return async_engine.sync_engine
+        return replica_engine.sync_engine
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session, flush_context):
+    session.info["wrote"] = True
+    session.info["use_primary"] = True
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+        orm_execute_state.session.info["use_primary"] = True
+
+# expire_on_commit=False: tras el commit los objetos se siguen leyendo sin I/O implícito
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(class_=AsyncSession, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False)
+
+async def get_db(request: Request):
+    async with AsyncSessionLocal() as db:
+        yield db
+        if db.sync_session.info.get("wrote"):
+            recent_writes.mark(_client_keys(request))
+
+async def get_read_db(request: Request):
+    """Como get_db pero las SELECT van a la réplica (si hay y no aplica la regla de primario)."""
+    async with ReadSessionLocal() as db:
+        if recent_writes.is_recent(_client_keys(request), settings.REPLICA_STICKY_SECONDS):
+            db.sync_session.info["use_primary"] = True
+        yield db
+        if db.sync_session.info.get("wrote"):
+            recent_writes.mark(_client_keys(request))
+
+@contextmanager
+def primary_reads(db: AsyncSession):
+    """
+    Lecturas al primario solo dentro del bloque: validez de sesión y estado de usuario, que
+    se cachean y no pueden venir de una réplica atrasada (la marca de escritura reciente es
+    por proceso y por cliente; un logout en otro worker no la ve). El resto del request
+    sigue yendo a la réplica.
+    """
+    info = db.sync_session.info
+    previous = info.get("use_primary")
+    info["use_primary"] = True
     try:
         yield db
     finally:
-        db.close()
+        if not previous and not info.get("wrote"):
+            info.pop("use_primary", None)
+
+def pool_stats() -> dict:
+    stats = {
+        "async": async_pool_metrics.stats(),
+        "sync": sync_pool_metrics.stats(),
+    }
+    if replica_engine is not None:
+        stats["replica"] = replica_pool_metrics.stats()
+    return stats
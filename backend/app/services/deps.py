@@ -1,19 +1,44 @@
 from fastapi import Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.app.services.config import settings
-from backend.app.services.database import get_db
+from backend.app.services.database import get_read_db, primary_reads
+from backend.app.services.session_cache import session_cache
+from backend.app.services.revocation import revocation_list
+from backend.app.services.touch_buffer import touch_buffer
+from backend.app.services.security import decode_access_token
 from backend.app import models
 import jwt
 from datetime import datetime, timezone
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> models.Usuario:
+async def _stateless_user(db: AsyncSession, payload: dict, uid: int, sid: str, now_utc: datetime) -> models.Usuario:
+    """
+    Modo sin estado: firma y exp ya verificados; la sesión se da por viva salvo que esté
+    en la lista de revocación. Solo se lee `usuario` (para el perfil) si no está en cache.
+    """
+    if revocation_list.is_revoked(sid, uid, payload.get("iat", 0)):
+        session_cache.invalidate(sid)
+        raise HTTPException(status_code=401, detail="Session not active")
+    cached = session_cache.get(sid)
+    if cached is not None and cached.usuario_id == uid:
+        if cached.estado != "activo":
+            raise HTTPException(status_code=401, detail="User inactive")
+        return models.Usuario(**cached.usuario)
+    with primary_reads(db):
+        user = await db.get(models.Usuario, uid)
+    if not user or user.estado != "activo":
+        raise HTTPException(status_code=401, detail="User inactive")
+    token_exp = datetime.fromtimestamp(payload["exp"], timezone.utc).replace(tzinfo=None)
+    session_cache.put_user(sid, user, token_exp)
+    return user
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_read_db)) -> models.Usuario:
     auth = request.headers.get("Authorization")
     if not auth or not auth.lower().startswith("bearer "):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token")
     token = auth.split(" ", 1)[1]
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = decode_access_token(token)
     except jwt.PyJWTError as e:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
@@ -22,20 +47,35 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> models.
     if not uid or not sid:
         raise HTTPException(status_code=401, detail="Invalid claims")
 
-    # verificar sesión viva
-    ses = db.get(models.Sesion, sid)
     # MySQL guarda datetime sin timezone, así que comparamos con datetime naive
     now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
-    if not ses or ses.revocada or ses.cierre is not None or now_utc > ses.expira_en:
-        raise HTTPException(status_code=401, detail="Session not active")
 
-    user = db.get(models.Usuario, int(uid))
-    if not user or user.estado != "activo":
-        raise HTTPException(status_code=401, detail="User inactive")
+    if settings.AUTH_STATELESS:
+        user = await _stateless_user(db, payload, int(uid), sid, now_utc)
+        touch_buffer.touch(sid, now_utc)
+        return user
+
+    cached = session_cache.get(sid)
+    if cached is not None:
+        if cached.usuario_id != int(uid) or now_utc > cached.expira_en:
+            session_cache.invalidate(sid)
+            raise HTTPException(status_code=401, detail="Session not active")
+        if cached.estado != "activo":
+            raise HTTPException(status_code=401, detail="User inactive")
+        # instancia transitoria (no ligada a la sesión de BD) con los datos de perfil
+        user = models.Usuario(**cached.usuario)
+    else:
+        # verificar sesión viva (del primario: el resultado se cachea)
+        with primary_reads(db):
+            ses = await db.get(models.Sesion, sid)
+            if not ses or ses.revocada or ses.cierre is not None or now_utc > ses.expira_en or ses.usuario_id != int(uid):
+                raise HTTPException(status_code=401, detail="Session not active")
+            user = await db.get(models.Usuario, int(uid))
+        if not user or user.estado != "activo":
+            raise HTTPException(status_code=401, detail="User inactive")
+        session_cache.put(ses, user)
 
-    # touch último movimiento
-    ses.ultimo_mov = now_utc
-    db.add(ses)
-    db.commit()
+    # touch último movimiento (write-behind, se agrupa en un UPDATE masivo)
+    touch_buffer.touch(sid, now_utc)
 
     return user
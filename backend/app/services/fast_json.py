@@ -0,0 +1,50 @@
+"""
+Serialización JSON rápida para las respuestas de auth y perfil.
+
+`FastJSONResponse` usa orjson (si está instalado; si no, json estándar) y los endpoints la
+devuelven directamente, así FastAPI no pasa por `jsonable_encoder` ni vuelve a validar
+contra `response_model` (que se mantiene solo para el esquema OpenAPI).
+`trusted_dump` copia los campos de un schema de salida desde un objeto interno de
+confianza (entidad ORM, fila) sin instanciar el modelo Pydantic.
+"""
+import json
+from typing import Any, Iterable
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+_fields_cache: dict[type, tuple[str, ...]] = {}
+
+def _fields(schema) -> tuple[str, ...]:
+    fields = _fields_cache.get(schema)
+    if fields is None:
+        fields = _fields_cache[schema] = tuple(schema.model_fields)
+    return fields
+
+
+def trusted_dump(schema, obj) -> dict:
+    """dict con los campos de `schema` leídos de `obj` (sin validación: el objeto es nuestro)."""
+    if isinstance(obj, dict):
+        return {f: obj.get(f) for f in _fields(schema)}
+    return {f: getattr(obj, f) for f in _fields(schema)}
+
+
+def trusted_dump_many(schema, objs: Iterable) -> list[dict]:
+    fields = _fields(schema)
+    return [{f: getattr(o, f) for f in fields} for o in objs]
@@ -0,0 +1,86 @@
+"""
+GET condicional (ETag / If-None-Match) y cache opcional de respuestas ya serializadas.
+
+El ETag sale de un marcador de versión barato (`updated_at` con precisión de microsegundos,
+que MySQL actualiza solo con ON UPDATE), así que decidir un 304 no requiere cargar ni
+serializar el recurso. Como el ETag forma parte de la clave del cache, un cambio en la
+fila invalida la entrada sin coordinación explícita.
+
+`ResponseCacheBackend` es el punto de extensión para un cache compartido (Redis, etc.);
+por defecto se usa un LRU en proceso.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Protocol
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .config import settings
+
+
+def make_etag(*parts) -> str:
+    """ETag débil a partir de las partes de versión (ids, timestamps, conteos)."""
+    raw = "|".join(p.isoformat() if isinstance(p, datetime) else str(p) for p in parts)
+    return 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [c.strip() for c in header.split(",")]
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any(c == etag or c == bare or c == "W/" + bare for c in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+def json_response(body: bytes, etag: str) -> Response:
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+class ResponseCacheBackend(Protocol):
+    def get(self, key: str) -> Optional[bytes]: ...
+    def set(self, key: str, value: bytes): ...
+
+
+class MemoryResponseCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+response_cache: Optional[ResponseCacheBackend] = (
+    MemoryResponseCache(settings.RESPONSE_CACHE_MAX_ENTRIES) if settings.RESPONSE_CACHE_MAX_ENTRIES > 0 else None
+)
+
+
+def cache_key(*parts) -> str:
+    return ":".join(str(p) for p in parts)
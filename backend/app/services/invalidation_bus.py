@@ -0,0 +1,377 @@
+"""
+Bus de invalidación entre workers.
+
+Los caches en proceso (`session_cache`, claves del `keyring`) se quedan obsoletos cuando
+otro worker revoca una sesión, cambia el estado de un usuario o rota claves. `crud` y el
+lifespan publican aquí eventos tipados; cada worker los recibe y limpia lo suyo.
+
+Transportes (`INVALIDATION_TRANSPORT`):
+- "inprocess": sin fanout, para un solo worker o pruebas;
+- "unix": un socket de datagramas por worker en `INVALIDATION_SOCKET_DIR`; publicar es
+  enviar un datagrama a cada socket hermano (misma máquina, sin dependencias);
+- "mysql": tabla `invalidacion_evento` consultada cada `INVALIDATION_POLL_SECONDS`
+  (sirve entre máquinas; latencia acotada por el intervalo).
+
+Cada evento lleva `origin` (worker emisor) y `seq` (consecutivo por origen). Si un
+suscriptor ve un salto en la secuencia, perdió eventos y vacía sus caches completos
+(`on_gap`). `stats()` expone publicados/recibidos, fanout y latencia de entrega.
+"""
+import json
+import os
+import queue
+import secrets
+import socket
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, Protocol
+
+from sqlalchemy import select, func, delete
+
+from .config import settings
+from .database import SessionLocal
+from ..models import models
+
+SESSION_REVOKED = "session_revoked"
+USER_UPDATED = "user_updated"
+KEY_ROTATED = "key_rotated"
+EVENT_KINDS = (SESSION_REVOKED, USER_UPDATED, KEY_ROTATED)
+
+
+@dataclass(frozen=True)
+class Event:
+    kind: str
+    key: str
+    origin: str
+    seq: int
+    emitted_at: float
+
+    def encode(self) -> bytes:
+        return json.dumps({"k": self.kind, "key": self.key, "o": self.origin, "s": self.seq, "t": self.emitted_at},
+                          separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def decode(cls, raw: bytes) -> "Event":
+        d = json.loads(raw)
+        return cls(kind=d["k"], key=d["key"], origin=d["o"], seq=int(d["s"]), emitted_at=float(d["t"]))
+
+
+class Transport(Protocol):
+    def publish(self, event: Event) -> int:
+        """Envía el evento; devuelve a cuántos destinos salió (fanout)."""
+        ...
+
+    def start(self, origin: str, deliver: Callable[[Event], None]): ...
+    def stop(self): ...
+
+
+class InProcessTransport:
+    def __init__(self):
+        self._deliver: Optional[Callable[[Event], None]] = None
+
+    def publish(self, event: Event) -> int:
+        if self._deliver is not None:
+            self._deliver(event)
+            return 1
+        return 0
+
+    def start(self, origin: str, deliver: Callable[[Event], None]):
+        self._deliver = deliver
+
+    def stop(self):
+        self._deliver = None
+
+
+class UnixSocketTransport:
+    PEERS_REFRESH_SECONDS = 1.0
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = ""
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._peers: list[str] = []
+        self._peers_at = 0.0
+        self.send_errors = 0
+
+    def _peer_paths(self) -> list[str]:
+        now = time.monotonic()
+        if now - self._peers_at > self.PEERS_REFRESH_SECONDS:
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                names = []
+            self._peers = [os.path.join(self.directory, n) for n in names if n.endswith(".sock")]
+            self._peers_at = now
+        return [p for p in self._peers if p != self.path]
+
+    def publish(self, event: Event) -> int:
+        raw = event.encode()
+        out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        out.setblocking(False)
+        sent = 0
+        try:
+            for peer in self._peer_paths():
+                try:
+                    out.sendto(raw, peer)
+                    sent += 1
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # worker que terminó sin limpiar su socket
+                    try:
+                        os.remove(peer)
+                    except OSError:
+                        pass
+                    self._peers_at = 0.0
+                except OSError:
+                    # buffer lleno: el receptor lo verá como hueco en la secuencia
+                    self.send_errors += 1
+        finally:
+            out.close()
+        return sent
+
+    def start(self, origin: str, deliver: Callable[[Event], None]):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{origin.replace(':', '_')}.sock")
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._sock.settimeout(0.5)
+        self._thread = threading.Thread(target=self._run, args=(deliver,), name="invalidation-bus-unix", daemon=True)
+        self._thread.start()
+
+    def _run(self, deliver: Callable[[Event], None]):
+        sock = self._sock
+        while self._sock is not None:
+            try:
+                raw = sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                deliver(Event.decode(raw))
+            except (ValueError, KeyError) as e:
+                print(f"[ERROR] UnixSocketTransport - evento inválido: {type(e).__name__}: {e}")
+
+    def stop(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class MySQLPollingTransport:
+    """
+    Publica con INSERT (desde el hilo de sondeo, nunca en el event loop) y recibe leyendo
+    `id > último visto`. Las filas más viejas que `retention_seconds` se borran al pasar.
+    Un INSERT de otro worker que confirma tarde (id menor al ya leído) se pierde; el
+    siguiente evento de ese origen lo delata como hueco y el suscriptor vacía sus caches.
+    """
+
+    def __init__(self, poll_seconds: float, retention_seconds: float = 3600, batch: int = 1000):
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self.batch = batch
+        self._outbox: "queue.SimpleQueue[Event]" = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_id = 0
+        self._pruned_at = 0.0
+
+    def publish(self, event: Event) -> int:
+        self._outbox.put(event)
+        return 1
+
+    def start(self, origin: str, deliver: Callable[[Event], None]):
+        db = SessionLocal()
+        try:
+            self._last_id = db.execute(select(func.coalesce(func.max(models.InvalidacionEvento.id), 0))).scalar_one()
+        finally:
+            db.close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(deliver,), name="invalidation-bus-mysql", daemon=True)
+        self._thread.start()
+
+    def _tick(self, deliver: Callable[[Event], None]):
+        T = models.InvalidacionEvento
+        rows = []
+        while True:
+            try:
+                e = self._outbox.get_nowait()
+            except queue.Empty:
+                break
+            rows.append({"origen": e.origin, "seq": e.seq, "tipo": e.kind, "clave": e.key,
+                         "emitido_en": datetime.fromtimestamp(e.emitted_at, timezone.utc).replace(tzinfo=None)})
+        db = SessionLocal()
+        try:
+            if rows:
+                db.execute(T.__table__.insert(), rows)
+                db.commit()
+            fetched = db.execute(
+                select(T.id, T.origen, T.seq, T.tipo, T.clave, T.emitido_en)
+                .where(T.id > self._last_id).order_by(T.id).limit(self.batch)
+            ).all()
+            now = time.monotonic()
+            if now - self._pruned_at > 60:
+                horizon = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=self.retention_seconds)
+                db.execute(delete(T).where(T.emitido_en < horizon))
+                db.commit()
+                self._pruned_at = now
+        finally:
+            db.close()
+        for r in fetched:
+            self._last_id = r.id
+            emitted = r.emitido_en.replace(tzinfo=timezone.utc).timestamp()
+            deliver(Event(kind=r.tipo, key=r.clave, origin=r.origen, seq=r.seq, emitted_at=emitted))
+
+    def _run(self, deliver: Callable[[Event], None]):
+        while not self._stop.is_set():
+            try:
+                self._tick(deliver)
+            except Exception as e:
+                print(f"[ERROR] MySQLPollingTransport - {type(e).__name__}: {e}")
+            self._stop.wait(self.poll_seconds)
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            # lo que quedó en la bandeja de salida se publica antes de salir
+            try:
+                self._tick(lambda e: None)
+            except Exception as e:
+                print(f"[ERROR] MySQLPollingTransport.stop - {type(e).__name__}: {e}")
+
+
+class InvalidationBus:
+    def __init__(self, transport: Transport):
+        self.transport = transport
+        self.origin = ""
+        self._handlers: dict[str, list[Callable[[Event], None]]] = {k: [] for k in EVENT_KINDS}
+        self._gap_handlers: list[Callable[[], None]] = []
+        self._seq = 0
+        self._last_seq: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self.published = 0
+        self.fanout_total = 0
+        self.received = 0
+        self.gaps = 0
+        self.latency_ms_ewma = 0.0
+        self.latency_ms_max = 0.0
+
+    def subscribe(self, kind: str, handler: Callable[[Event], None]):
+        if kind not in self._handlers:
+            raise ValueError(f"Tipo de evento desconocido: {kind}")
+        self._handlers[kind].append(handler)
+
+    def on_gap(self, handler: Callable[[], None]):
+        self._gap_handlers.append(handler)
+
+    def publish(self, kind: str, key) -> Optional[Event]:
+        """Avisa a los otros workers; quien publica ya invalidó su propio cache."""
+        if not self._started:
+            return None
+        with self._lock:
+            self._seq += 1
+            event = Event(kind=kind, key=str(key), origin=self.origin, seq=self._seq, emitted_at=time.time())
+        fanout = self.transport.publish(event)
+        self.published += 1
+        self.fanout_total += fanout
+        return event
+
+    def _deliver(self, event: Event):
+        if event.origin == self.origin:
+            return
+        with self._lock:
+            last = self._last_seq.get(event.origin)
+            self._last_seq[event.origin] = max(event.seq, last or 0)
+            gap = last is not None and event.seq > last + 1
+            self.received += 1
+            latency = max(0.0, (time.time() - event.emitted_at) * 1000)
+            self.latency_ms_ewma = latency if self.received == 1 else 0.9 * self.latency_ms_ewma + 0.1 * latency
+            self.latency_ms_max = max(self.latency_ms_max, latency)
+            if gap:
+                self.gaps += 1
+        if gap:
+            # eventos perdidos: no sabemos qué quedó obsoleto, se descarta todo
+            for h in self._gap_handlers:
+                h()
+        for h in self._handlers.get(event.kind, ()):
+            try:
+                h(event)
+            except Exception as e:
+                print(f"[ERROR] InvalidationBus handler {event.kind} - {type(e).__name__}: {e}")
+
+    def start(self):
+        if self._started:
+            return
+        # el origen se fija al arrancar (ya dentro del worker, después de un posible fork)
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.transport.start(self.origin, self._deliver)
+        self._started = True
+
+    def stop(self):
+        if self._started:
+            self._started = False
+            self.transport.stop()
+
+    def stats(self) -> dict:
+        return {
+            "transport": type(self.transport).__name__,
+            "origin": self.origin,
+            "published": self.published,
+            "fanout_avg": round(self.fanout_total / self.published, 2) if self.published else 0.0,
+            "received": self.received,
+            "gaps": self.gaps,
+            "latency_ms_ewma": round(self.latency_ms_ewma, 3),
+            "latency_ms_max": round(self.latency_ms_max, 3),
+            "peers_seen": len(self._last_seq),
+        }
+
+
+def build_transport() -> Transport:
+    kind = settings.INVALIDATION_TRANSPORT
+    if kind == "unix":
+        directory = settings.INVALIDATION_SOCKET_DIR or os.path.join(tempfile.gettempdir(), "auth_invalidation")
+        return UnixSocketTransport(directory)
+    if kind == "mysql":
+        return MySQLPollingTransport(poll_seconds=settings.INVALIDATION_POLL_SECONDS)
+    if kind == "inprocess":
+        return InProcessTransport()
+    raise ValueError(f"INVALIDATION_TRANSPORT desconocido: {kind}")
+
+
+bus = InvalidationBus(build_transport())
+
+
+def install_cache_handlers(bus: InvalidationBus):
+    """Conecta los caches en proceso de este worker a los eventos del bus."""
+    from .session_cache import session_cache
+    from .touch_buffer import touch_buffer
+    from .keyring import keyring
+
+    def _session_revoked(event: Event):
+        session_cache.invalidate(event.key)
+        touch_buffer.forget(event.key)
+
+    bus.subscribe(SESSION_REVOKED, _session_revoked)
+    bus.subscribe(USER_UPDATED, lambda event: session_cache.invalidate_user(int(event.key)))
+    if keyring is not None:
+        bus.subscribe(KEY_ROTATED, lambda event: keyring.load())
+    bus.on_gap(session_cache.clear)
+
+
+install_cache_handlers(bus)
@@ -0,0 +1,223 @@
+"""
+Limpieza periódica de tablas que solo crecen: `sesion`, `refresh_historial`, `otp_codigo`,
+`password_reset_token` y `verificacion_contacto`.
+
+Corre como hilo de fondo en el lifespan (cada `JANITOR_INTERVAL_SECONDS`) y como CLI:
+    python -m backend.app.services.janitor [--once]
+
+Todo se hace en tramos ordenados por clave (`id > último ORDER BY id LIMIT n`), un commit
+por tramo y una pausa de `JANITOR_THROTTLE_MS` entre tramos, así ninguna transacción
+retiene locks mucho tiempo. Con varios workers, solo uno limpia a la vez (GET_LOCK).
+
+Cada pasada:
+- revoca sesiones activas sin movimiento en `SESSION_IDLE_TIMEOUT_MINUTES` (o ya vencidas);
+- borra sesiones cerradas hace más de `JANITOR_SESSION_RETENTION_DAYS` y su historial;
+- poda `refresh_historial` de tokens ya vencidos (su huella ya no detecta nada);
+- borra OTPs, tokens de reset y verificaciones vencidos hace más de `JANITOR_TOKEN_RETENTION_HOURS`;
+- rota las particiones de `acceso_log` (services/log_retention.py).
+"""
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import select, update, delete, and_, or_, text
+
+from .config import settings
+from .database import SessionLocal, engine
+from .session_cache import session_cache
+from .revocation import revocation_list
+from .invalidation_bus import bus, SESSION_REVOKED
+from .touch_buffer import touch_buffer
+from .log_retention import log_retention
+from ..models import models
+
+_LOCK_NAME = "auth_janitor"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Janitor:
+    def __init__(self, interval_seconds: float, chunk_size: int, throttle_ms: float, max_chunks_per_task: int):
+        self.interval = interval_seconds
+        self.chunk_size = chunk_size
+        self.throttle = throttle_ms / 1000
+        self.max_chunks = max_chunks_per_task
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.last_run: dict = {}
+
+    # ----------- tramos -----------
+
+    def _chunked(self, db, table, condition, apply, after_commit=None) -> int:
+        """
+        Recorre `table` por id en tramos que cumplen `condition`; `apply(ids)` devuelve filas
+        afectadas. `after_commit()` corre tras el commit de cada tramo.
+        """
+        last_id = None
+        total = 0
+        for _ in range(self.max_chunks):
+            if self._stop.is_set():
+                break
+            stmt = select(table.id).where(condition).order_by(table.id).limit(self.chunk_size)
+            if last_id is not None:
+                stmt = stmt.where(table.id > last_id)
+            ids = db.execute(stmt).scalars().all()
+            if not ids:
+                break
+            total += apply(ids)
+            db.commit()
+            if after_commit is not None:
+                after_commit()
+            last_id = ids[-1]
+            if len(ids) < self.chunk_size:
+                break
+            time.sleep(self.throttle)
+        return total
+
+    def _delete_by_ids(self, db, table):
+        def apply(ids):
+            return db.execute(delete(table).where(table.id.in_(ids)).execution_options(synchronize_session=False)).rowcount or 0
+        return apply
+
+    # ----------- tareas -----------
+
+    def revoke_idle_sessions(self, db, now: datetime) -> int:
+        if settings.SESSION_IDLE_TIMEOUT_MINUTES <= 0:
+            idle = models.Sesion.expira_en < now
+        else:
+            idle_horizon = now - timedelta(minutes=settings.SESSION_IDLE_TIMEOUT_MINUTES)
+            idle = or_(models.Sesion.ultimo_mov < idle_horizon, models.Sesion.expira_en < now)
+        S = models.Sesion
+        live = and_(S.cierre.is_(None), S.revocada == False)
+        revoked: list[str] = []
+
+        def apply(ids):
+            # MySQL no tiene RETURNING: se bloquean y se leen las que siguen vivas, y solo esas se revocan
+            # (un logout o un refresh concurrente pudo cerrarla o renovarla entre el SELECT del tramo y aquí)
+            revoked[:] = db.execute(select(S.id).where(S.id.in_(ids), live, idle).with_for_update()).scalars().all()
+            if not revoked:
+                return 0
+            return db.execute(
+                update(S).where(S.id.in_(revoked))
+                .values(revocada=True, cierre=now, refresh_hash=None, refresh_expira_en=None)
+                .execution_options(synchronize_session=False)
+            ).rowcount or 0
+
+        def after_commit():
+            # avisar solo lo que de verdad se revocó, y ya confirmado
+            for sid in revoked:
+                session_cache.invalidate(sid)
+                revocation_list.revoke_session(sid)
+                touch_buffer.forget(sid)
+                bus.publish(SESSION_REVOKED, sid)
+            revoked.clear()
+
+        return self._chunked(db, S, and_(live, idle), apply, after_commit)
+
+    def purge_closed_sessions(self, db, now: datetime) -> tuple[int, int]:
+        horizon = now - timedelta(days=settings.JANITOR_SESSION_RETENTION_DAYS)
+        S, H = models.Sesion, models.RefreshHistorial
+        history = 0
+
+        def apply(ids):
+            nonlocal history
+            # primero el historial (FK hacia sesion)
+            history += db.execute(delete(H).where(H.sesion_id.in_(ids)).execution_options(synchronize_session=False)).rowcount or 0
+            return db.execute(delete(S).where(S.id.in_(ids)).execution_options(synchronize_session=False)).rowcount or 0
+
+        sessions = self._chunked(db, S, and_(S.cierre.is_not(None), S.cierre < horizon), apply)
+        return sessions, history
+
+    def prune_refresh_history(self, db, now: datetime) -> int:
+        H = models.RefreshHistorial
+        legacy_horizon = now - timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        condition = or_(H.expira_en < now, and_(H.expira_en.is_(None), H.rotado_en < legacy_horizon))
+        return self._chunked(db, H, condition, self._delete_by_ids(db, H))
+
+    def purge_expired_tokens(self, db, now: datetime) -> dict:
+        horizon = now - timedelta(hours=settings.JANITOR_TOKEN_RETENTION_HOURS)
+        out = {}
+        for table in (models.OTPCodigo, models.PasswordResetToken, models.VerificacionContacto):
+            out[table.__tablename__] = self._chunked(db, table, table.expira_en < horizon, self._delete_by_ids(db, table))
+        return out
+
+    # ----------- ejecución -----------
+
+    def run_once(self) -> dict:
+        """Una pasada completa. Devuelve filas afectadas por tabla (vacío si otro worker tiene el lock)."""
+        started = time.monotonic()
+        # el lock con nombre vive en su propia conexión: la sesión de trabajo la suelta en cada commit
+        with engine.connect() as lock_conn:
+            if not lock_conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": _LOCK_NAME}).scalar():
+                return {}
+            db = SessionLocal()
+            try:
+                now = _utcnow()
+                report = {"sesion_revocadas": self.revoke_idle_sessions(db, now)}
+                report["sesion"], history = self.purge_closed_sessions(db, now)
+                report["refresh_historial"] = history + self.prune_refresh_history(db, now)
+                report.update(self.purge_expired_tokens(db, now))
+                report["acceso_log"] = log_retention.run_once()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+                lock_conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": _LOCK_NAME})
+        report["segundos"] = round(time.monotonic() - started, 3)
+        self.runs += 1
+        self.last_run = report
+        print(f"[INFO] janitor - {report}")
+        return report
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[ERROR] janitor - {type(e).__name__}: {e}")
+
+    def stats(self) -> dict:
+        return {"running": self._thread is not None, "runs": self.runs, "last_run": self.last_run}
+
+
+janitor = Janitor(
+    interval_seconds=settings.JANITOR_INTERVAL_SECONDS,
+    chunk_size=settings.JANITOR_CHUNK_SIZE,
+    throttle_ms=settings.JANITOR_THROTTLE_MS,
+    max_chunks_per_task=settings.JANITOR_MAX_CHUNKS_PER_TASK,
+)
+
+
+def main(argv: list[str]):
+    if "--once" in argv or janitor.interval <= 0:
+        janitor.run_once()
+        return
+    janitor.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        janitor.stop()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
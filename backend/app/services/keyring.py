@@ -0,0 +1,196 @@
+"""
+Anillo de claves para firmar access tokens con algoritmos asimétricos (EdDSA / RS256).
+
+Las claves privadas viven en `JWT_KEYS_DIR` como `<kid>.pem`; el kid empieza con el epoch
+de creación, así todos los workers derivan la misma antigüedad sin metadatos aparte.
+
+Rotación programada:
+- una clave nueva se genera cuando la activa cumple `JWT_KEY_ROTATION_HOURS`;
+- se publica en JWKS de inmediato pero solo se usa para firmar después de
+  `JWT_KEY_ACTIVATION_DELAY_SECONDS` (>= max-age de JWKS), para que los verificadores
+  externos la tengan en cache antes de ver el primer token con ese kid;
+- una clave reemplazada se conserva mientras puedan existir tokens firmados con ella
+  (activación de la siguiente + vida del access token) y después se borra.
+
+Las claves públicas ya parseadas se cachean por kid; un kid desconocido fuerza a releer el
+directorio (como mucho una vez cada `JWT_KEYS_RELOAD_SECONDS`).
+"""
+import base64
+import fcntl
+import os
+import secrets
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+from .config import settings
+
+ASYMMETRIC_ALGORITHMS = ("EdDSA", "RS256")
+
+
+class SigningKey(NamedTuple):
+    kid: str
+    created_at: float
+    private_key: object
+    public_key: object
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _int_b64url(n: int) -> str:
+    return _b64url(n.to_bytes((n.bit_length() + 7) // 8, "big"))
+
+
+class KeyRing:
+    def __init__(self, directory: str, algorithm: str, rotation_seconds: float,
+                 activation_delay_seconds: float, token_lifetime_seconds: float, reload_seconds: float):
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Algoritmo no soportado por el key ring: {algorithm}")
+        self.directory = directory
+        self.algorithm = algorithm
+        self.rotation_seconds = rotation_seconds
+        self.activation_delay = activation_delay_seconds
+        self.token_lifetime = token_lifetime_seconds
+        self.reload_seconds = reload_seconds
+        self._keys: list[SigningKey] = []   # ordenadas por antigüedad (más vieja primero)
+        self._by_kid: dict[str, SigningKey] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.rotations = 0
+
+    # ----------- carga / persistencia -----------
+
+    def _generate_private_key(self):
+        if self.algorithm == "EdDSA":
+            return ed25519.Ed25519PrivateKey.generate()
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def load(self):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        keys = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pem"):
+                continue
+            kid = name[:-4]
+            known = self._by_kid.get(kid)
+            if known is not None:
+                keys.append(known)
+                continue
+            try:
+                created_at = float(kid.split("-", 1)[0])
+                with open(os.path.join(self.directory, name), "rb") as fh:
+                    private_key = serialization.load_pem_private_key(fh.read(), password=None)
+            except (ValueError, OSError) as e:
+                print(f"[ERROR] KeyRing.load - {name}: {type(e).__name__}: {e}")
+                continue
+            keys.append(SigningKey(kid, created_at, private_key, private_key.public_key()))
+        keys.sort(key=lambda k: k.created_at)
+        with self._lock:
+            self._keys = keys
+            self._by_kid = {k.kid: k for k in keys}
+            self._loaded_at = time.monotonic()
+
+    def _write_key(self, now: float) -> str:
+        kid = f"{int(now)}-{secrets.token_hex(4)}"
+        pem = self._generate_private_key().private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+        tmp = os.path.join(self.directory, f".{kid}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(pem)
+        os.replace(tmp, os.path.join(self.directory, f"{kid}.pem"))
+        return kid
+
+    def rotate_if_due(self, now: Optional[float] = None) -> bool:
+        """Genera la siguiente clave si toca y borra las que ya no pueden verificar nada."""
+        now = time.time() if now is None else now
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        lock_fd = os.open(os.path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        rotated = False
+        try:
+            # un solo worker rota; los demás releen lo que dejó
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            self.load()
+            newest = self._keys[-1] if self._keys else None
+            if newest is None or now - newest.created_at >= self.rotation_seconds:
+                self._write_key(now)
+                rotated = True
+                self.rotations += 1
+                self.load()
+            self._prune(now)
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+        return rotated
+
+    def _prune(self, now: float):
+        keys = self._keys
+        for older, newer in zip(keys, keys[1:]):
+            superseded_at = newer.created_at + self.activation_delay
+            if now > superseded_at + self.token_lifetime + 60:
+                try:
+                    os.remove(os.path.join(self.directory, f"{older.kid}.pem"))
+                except FileNotFoundError:
+                    pass
+        self.load()
+
+    # ----------- uso -----------
+
+    def signing_key(self, now: Optional[float] = None) -> SigningKey:
+        """La clave más nueva ya activada (o la única, en el primer arranque)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            keys = list(self._keys)
+        if not keys:
+            self.rotate_if_due(now)
+            with self._lock:
+                keys = list(self._keys)
+        for key in reversed(keys):
+            if now - key.created_at >= self.activation_delay:
+                return key
+        return keys[0]
+
+    def verification_key(self, kid: str):
+        with self._lock:
+            key = self._by_kid.get(kid)
+            stale = time.monotonic() - self._loaded_at > self.reload_seconds
+        if key is None and stale:
+            self.load()
+            with self._lock:
+                key = self._by_kid.get(kid)
+        return key.public_key if key is not None else None
+
+    def jwks(self) -> dict:
+        with self._lock:
+            keys = list(self._keys)
+        out = []
+        for k in keys:
+            jwk = {"kid": k.kid, "use": "sig", "alg": self.algorithm}
+            if isinstance(k.public_key, ed25519.Ed25519PublicKey):
+                raw = k.public_key.public_bytes(encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw)
+                jwk.update(kty="OKP", crv="Ed25519", x=_b64url(raw))
+            else:
+                numbers = k.public_key.public_numbers()
+                jwk.update(kty="RSA", n=_int_b64url(numbers.n), e=_int_b64url(numbers.e))
+            out.append(jwk)
+        return {"keys": out}
+
+
+keyring: Optional[KeyRing] = None
+if settings.JWT_ALGORITHM in ASYMMETRIC_ALGORITHMS:
+    keyring = KeyRing(
+        directory=settings.JWT_KEYS_DIR,
+        algorithm=settings.JWT_ALGORITHM,
+        rotation_seconds=settings.JWT_KEY_ROTATION_HOURS * 3600,
+        activation_delay_seconds=settings.JWT_KEY_ACTIVATION_DELAY_SECONDS,
+        token_lifetime_seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        reload_seconds=settings.JWT_KEYS_RELOAD_SECONDS,
+    )
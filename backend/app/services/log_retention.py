@@ -0,0 +1,240 @@
+"""
+Retención de `acceso_log` por particiones mensuales (RANGE COLUMNS sobre `momento`).
+
+- rollover: mantiene creadas las particiones de los próximos `ACCESO_LOG_PARTITIONS_AHEAD`
+  meses partiendo `pmax` (REORGANIZE de una partición vacía: no copia filas; si `pmax`
+  tiene filas, no se toca y se avisa). Si la tabla la creó `create_all` sin particiones
+  y está vacía, la particiona desde el mes actual; el lifespan lo corre al arrancar;
+- archivo: cada partición cuyo límite superior quedó fuera de `ACCESO_LOG_RETENTION_MONTHS`
+  se exporta a `ACCESO_LOG_ARCHIVE_DIR/acceso_log-<partición>.ndjson.gz` en tramos por id y,
+  si el conteo coincide, la partición se pasa a una tabla suelta con EXCHANGE PARTITION y se
+  descarta con DROP PARTITION (ambos solo metadatos: ni DELETE ni locks largos). La tabla
+  suelta ya no recibe filas: se verifica contra el archivo (reexportando si llegó algo entre
+  medio) y se borra.
+
+El janitor lo corre en cada pasada (bajo su lock); también hay CLI:
+    python -m backend.app.services.log_retention [--rollover] [--archive]
+"""
+import gzip
+import os
+import sys
+from datetime import date, datetime, timezone
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+
+from .config import settings
+from .database import engine
+from .fast_json import dumps
+
+TABLE = "acceso_log"
+_DETACHED_PREFIX = TABLE + "_archivo_"
+_LOCK_NAME = "acceso_log_rollover"
+_COLUMNS = "id, usuario_id, email_intentado, momento, exito, ip, detalle"
+
+
+class Partition(NamedTuple):
+    name: str
+    upper: Optional[date]   # None = MAXVALUE
+    rows: int               # estimación de information_schema
+
+
+def _month_start(d: date, add_months: int = 0) -> date:
+    months = d.year * 12 + (d.month - 1) + add_months
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def _parse_bound(description: str) -> Optional[date]:
+    if description is None or description.upper() == "MAXVALUE":
+        return None
+    return datetime.fromisoformat(description.strip("'").split(" ")[0]).date()
+
+
+class LogRetention:
+    def __init__(self, retention_months: int, partitions_ahead: int, archive_dir: str, chunk_size: int):
+        self.retention_months = retention_months
+        self.partitions_ahead = partitions_ahead
+        self.archive_dir = archive_dir
+        self.chunk_size = chunk_size
+
+    def partitions(self, conn) -> list[Partition]:
+        rows = conn.execute(text(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        ), {"t": TABLE}).all()
+        return [Partition(r[0], _parse_bound(r[1]), int(r[2] or 0)) for r in rows]
+
+    # ----------- rollover -----------
+
+    def _partition_table(self, conn, today: date, target: date) -> list[str]:
+        """Particiona una `acceso_log` recién creada por `create_all` (vacía: el ALTER no copia filas)."""
+        if conn.execute(text(f"SELECT 1 FROM {TABLE} LIMIT 1")).first():
+            print(f"[WARN] log_retention - {TABLE} no está particionada y tiene filas; aplicar sql/migrations/005_acceso_log_partitions.sql")
+            return []
+        month = _month_start(today)
+        names, clauses = [], [f"PARTITION p_hist VALUES LESS THAN ('{month:%Y-%m-%d}')"]
+        while month < target:
+            nxt = _month_start(month, 1)
+            names.append(f"p{month:%Y%m}")
+            clauses.append(f"PARTITION {names[-1]} VALUES LESS THAN ('{nxt:%Y-%m-%d}')")
+            month = nxt
+        clauses.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+        conn.execute(text(f"ALTER TABLE {TABLE} PARTITION BY RANGE COLUMNS(momento) ({', '.join(clauses)})"))
+        return ["p_hist"] + names + ["pmax"]
+
+    def rollover(self, today: Optional[date] = None) -> list[str]:
+        """Crea las particiones mensuales que falten hasta `hoy + PARTITIONS_AHEAD` meses."""
+        today = today or datetime.now(timezone.utc).date()
+        target = _month_start(today, self.partitions_ahead + 1)
+        with engine.connect() as conn:
+            # varios workers arrancan a la vez: solo uno hace el DDL, los demás lo encuentran hecho
+            if not conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": _LOCK_NAME}).scalar():
+                return []
+            try:
+                return self._rollover(conn, today, target)
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": _LOCK_NAME})
+
+    def _rollover(self, conn, today: date, target: date) -> list[str]:
+        parts = self.partitions(conn)
+        if not parts:
+            return self._partition_table(conn, today, target)
+        created = []
+        bounds = [p.upper for p in parts if p.upper is not None]
+        if not bounds or parts[-1].upper is not None:
+            print(f"[WARN] log_retention - {TABLE} sin partición MAXVALUE; no se puede hacer rollover")
+            return created
+        upper = max(bounds)
+        if upper < target and conn.execute(text(f"SELECT 1 FROM {TABLE} PARTITION ({parts[-1].name}) LIMIT 1")).first():
+            # partir una MAXVALUE con filas las copia con la tabla bloqueada; mejor que lo decida un humano
+            print(f"[WARN] log_retention - {parts[-1].name} tiene filas (≥ {upper}); no se hace rollover")
+            return created
+        while upper < target:
+            name = f"p{upper:%Y%m}"
+            nxt = _month_start(upper, 1)
+            conn.execute(text(
+                f"ALTER TABLE {TABLE} REORGANIZE PARTITION {parts[-1].name} INTO ("
+                f"PARTITION {name} VALUES LESS THAN ('{nxt:%Y-%m-%d}'), "
+                f"PARTITION {parts[-1].name} VALUES LESS THAN (MAXVALUE))"
+            ))
+            created.append(name)
+            upper = nxt
+        return created
+
+    # ----------- archivo -----------
+
+    def _export(self, conn, source: str, name: str) -> tuple[str, int]:
+        """Vuelca `source` (una partición o la tabla suelta) a `<archive_dir>/acceso_log-<name>.ndjson.gz`."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{TABLE}-{name}.ndjson.gz")
+        tmp = path + ".tmp"
+        written = 0
+        last_id = 0
+        with gzip.open(tmp, "wb") as fh:
+            while True:
+                rows = conn.execute(text(
+                    f"SELECT {_COLUMNS} FROM {source} WHERE id > :last ORDER BY id LIMIT :n"
+                ), {"last": last_id, "n": self.chunk_size}).mappings().all()
+                if not rows:
+                    break
+                for r in rows:
+                    fh.write(dumps(dict(r)) + b"\n")
+                written += len(rows)
+                last_id = rows[-1]["id"]
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        return path, written
+
+    def _detach(self, conn, partition: str) -> str:
+        """Saca la partición a una tabla suelta con EXCHANGE y la descarta (solo metadatos: lock breve)."""
+        detached = _DETACHED_PREFIX + partition
+        conn.execute(text(f"CREATE TABLE {detached} LIKE {TABLE}"))
+        conn.execute(text(f"ALTER TABLE {detached} REMOVE PARTITIONING"))
+        conn.execute(text(f"ALTER TABLE {TABLE} EXCHANGE PARTITION {partition} WITH TABLE {detached}"))
+        conn.execute(text(f"ALTER TABLE {TABLE} DROP PARTITION {partition}"))
+        conn.commit()
+        return detached
+
+    def _finish_detached(self, conn, detached: str, written: Optional[int]) -> tuple[str, int]:
+        """La tabla suelta ya no recibe filas: si no coincide con lo exportado, se reexporta de ella."""
+        name = detached[len(_DETACHED_PREFIX):]
+        path = os.path.join(self.archive_dir, f"{TABLE}-{name}.ndjson.gz")
+        rows = conn.execute(text(f"SELECT COUNT(*) FROM {detached}")).scalar_one()
+        if rows == 0 and written is None:
+            # corte antes del EXCHANGE: las filas siguen en la partición, no se pisa el archivo
+            written = 0
+        elif rows != written:
+            path, written = self._export(conn, detached, name)
+        conn.commit()
+        conn.execute(text(f"DROP TABLE {detached}"))
+        conn.commit()
+        return path, written
+
+    def archive_expired(self, today: Optional[date] = None) -> dict:
+        """Exporta y descarta las particiones vencidas. Devuelve {partición: filas archivadas}."""
+        today = today or datetime.now(timezone.utc).date()
+        cutoff = _month_start(today, -self.retention_months)
+        archived = {}
+        with engine.connect() as conn:
+            # tablas sueltas de una pasada que se cortó entre el EXCHANGE y el DROP TABLE
+            leftovers = conn.execute(text(
+                "SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE :p"
+            ), {"p": _DETACHED_PREFIX.replace("_", "\\_") + "%"}).scalars().all()
+            conn.commit()
+            for detached in leftovers:
+                path, written = self._finish_detached(conn, detached, None)
+                if written:
+                    archived[detached[len(_DETACHED_PREFIX):]] = written
+                    print(f"[INFO] log_retention - {detached}: {written} filas -> {path}")
+
+            for p in self.partitions(conn):
+                if p.upper is None or p.upper > cutoff:
+                    continue
+                count = text(f"SELECT COUNT(*) FROM {TABLE} PARTITION ({p.name})")
+                if conn.execute(count).scalar_one() == 0:
+                    # vacía (o ya pasada a tabla suelta en una pasada cortada): nada que exportar ni pisar
+                    conn.commit()
+                    conn.execute(text(f"ALTER TABLE {TABLE} DROP PARTITION {p.name}"))
+                    conn.commit()
+                    continue
+                conn.commit()
+                # export y conteo sin locks (el conteo en una transacción nueva, no en el snapshot del export)
+                path, written = self._export(conn, f"{TABLE} PARTITION ({p.name})", p.name)
+                conn.commit()
+                expected = conn.execute(count).scalar_one()
+                conn.commit()
+                if written != expected:
+                    # siguen llegando filas (reloj desfasado, inserciones tardías): se reintenta en la próxima pasada
+                    print(f"[WARN] log_retention - {p.name}: exportadas {written} de {expected}; no se descarta")
+                    continue
+                # lo que llegue entre el conteo y el EXCHANGE queda en la tabla suelta y se reexporta de ahí
+                path, written = self._finish_detached(conn, self._detach(conn, p.name), written)
+                archived[p.name] = written
+                print(f"[INFO] log_retention - {p.name}: {written} filas -> {path}")
+        return archived
+
+    def run_once(self) -> dict:
+        return {"particiones_creadas": self.rollover(), "particiones_archivadas": self.archive_expired()}
+
+
+log_retention = LogRetention(
+    retention_months=settings.ACCESO_LOG_RETENTION_MONTHS,
+    partitions_ahead=settings.ACCESO_LOG_PARTITIONS_AHEAD,
+    archive_dir=settings.ACCESO_LOG_ARCHIVE_DIR,
+    chunk_size=settings.JANITOR_CHUNK_SIZE * 10,
+)
+
+
+def main(argv: list[str]):
+    do_rollover = "--rollover" in argv or "--archive" not in argv
+    do_archive = "--archive" in argv or "--rollover" not in argv
+    if do_rollover:
+        print("particiones creadas:", log_retention.rollover())
+    if do_archive:
+        print("particiones archivadas:", log_retention.archive_expired())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,112 @@
+"""
+Instrumentación de los pools de conexiones de SQLAlchemy.
+
+Se apoya en los eventos de pool (checkout, checkin, connect, invalidate) y en una
+subclase del pool que mide cuánto espera `_do_get` por una conexión libre. Los números
+(checkouts, espera, overflow en uso y su máximo, invalidaciones) se exponen en
+`/health/ready` y sirven para dimensionar workers contra `max_connections` de MySQL.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.checkout_timeouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.overflow_max = 0
+        self._pool = None
+
+    def observe_wait(self, wait_ms: float, timed_out: bool):
+        with self._lock:
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            if timed_out:
+                self.checkout_timeouts += 1
+
+    def attach(self, engine):
+        """Registra los listeners en un Engine síncrono (para AsyncEngine usar `.sync_engine`)."""
+        self._pool = engine.pool
+
+        @event.listens_for(engine, "connect")
+        def _connect(dbapi_conn, record):
+            with self._lock:
+                self.connects += 1
+
+        @event.listens_for(engine, "checkout")
+        def _checkout(dbapi_conn, record, proxy):
+            pool = self._pool
+            with self._lock:
+                self.checkouts += 1
+                if pool is not None and hasattr(pool, "overflow"):
+                    self.overflow_max = max(self.overflow_max, pool.overflow())
+
+        @event.listens_for(engine, "checkin")
+        def _checkin(dbapi_conn, record):
+            with self._lock:
+                self.checkins += 1
+
+        @event.listens_for(engine, "invalidate")
+        def _invalidate(dbapi_conn, record, exc):
+            with self._lock:
+                self.invalidations += 1
+
+        @event.listens_for(engine, "soft_invalidate")
+        def _soft_invalidate(dbapi_conn, record, exc):
+            with self._lock:
+                self.soft_invalidations += 1
+
+        @event.listens_for(engine, "engine_disposed")
+        def _disposed(engine_):
+            self._pool = engine_.pool
+
+    def stats(self) -> dict:
+        pool = self._pool
+        live = {}
+        if pool is not None and hasattr(pool, "size"):
+            live = {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+        with self._lock:
+            return {
+                **live,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "checkout_wait_avg_ms": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "checkout_wait_max_ms": round(self.wait_max_ms, 3),
+                "checkout_timeouts": self.checkout_timeouts,
+                "overflow_max": self.overflow_max,
+                "invalidations": self.invalidations,
+                "soft_invalidations": self.soft_invalidations,
+            }
+
+
+def timed_pool_class(base, metrics: PoolMetrics):
+    """Subclase de `base` que mide la espera por conexión; sobrevive a `dispose()`/`recreate()`."""
+    def _do_get(self):
+        t0 = time.perf_counter()
+        timed_out = False
+        try:
+            return base._do_get(self)
+        except PoolTimeout:
+            timed_out = True
+            raise
+        finally:
+            metrics.observe_wait((time.perf_counter() - t0) * 1000.0, timed_out)
+
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
@@ -0,0 +1,269 @@
+"""
+Control de admisión para los endpoints de auth (`/auth/login`, `/auth/register`, `/auth/refresh`).
+
+Token bucket por IP y, en login, también por email y por IP+email (el email sale del body,
+que no puede pasar de `RATE_LIMIT_MAX_BODY_BYTES`: si pasa, 413). Se evalúa en un middleware ASGI antes de
+que el request llegue al handler, así un exceso se rechaza con 429 + Retry-After sin tocar
+MySQL ni bcrypt.
+
+El estado vive detrás de `RateLimitBackend`:
+- `SharedMemoryBackend` (por defecto): tabla de tamaño fijo en memoria compartida POSIX,
+  protegida con `flock`, visible para todos los workers de uvicorn de la máquina.
+- `MemoryBackend`: dict por proceso (desarrollo / un solo worker).
+Un backend externo (Redis, etc.) solo necesita implementar `acquire`.
+"""
+import fcntl
+import hashlib
+import json
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+from typing import NamedTuple, Optional, Protocol
+
+from starlette.responses import JSONResponse
+
+from .config import settings
+
+
+class Bucket(NamedTuple):
+    key: str
+    capacity: int
+    refill_per_second: float
+
+
+class RateLimitBackend(Protocol):
+    def acquire(self, buckets: list[Bucket], now: float) -> float:
+        """
+        Consume un token de cada bucket si todos tienen saldo (todo o nada).
+        Devuelve 0 si se admitió o los segundos a esperar si no.
+        """
+        ...
+
+
+def _refill(tokens: float, last: float, bucket: Bucket, now: float) -> float:
+    return min(bucket.capacity, tokens + max(0.0, now - last) * bucket.refill_per_second)
+
+
+def _retry_after(tokens: float, bucket: Bucket) -> float:
+    return (1.0 - tokens) / bucket.refill_per_second if bucket.refill_per_second > 0 else 60.0
+
+
+class MemoryBackend:
+    """Buckets en un dict LRU acotado, solo para el proceso actual."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._state: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, buckets: list[Bucket], now: float) -> float:
+        with self._lock:
+            current = []
+            wait = 0.0
+            for b in buckets:
+                tokens, last = self._state.get(b.key, (float(b.capacity), now))
+                tokens = _refill(tokens, last, b, now)
+                current.append(tokens)
+                if tokens < 1.0:
+                    wait = max(wait, _retry_after(tokens, b))
+            if wait:
+                return wait
+            for b, tokens in zip(buckets, current):
+                self._state[b.key] = (tokens - 1.0, now)
+                self._state.move_to_end(b.key)
+            while len(self._state) > self.max_keys:
+                self._state.popitem(last=False)
+            return 0.0
+
+
+class SharedMemoryBackend:
+    """
+    Tabla hash de direccionamiento abierto en un segmento de memoria compartida.
+    Cada slot: (hash de la clave u64, tokens f64, último acceso f64). Si la ventana de
+    sondeo está llena se reutiliza el slot con el acceso más antiguo.
+    """
+
+    SLOT = struct.Struct("<Qdd")
+    PROBE = 8
+
+    def __init__(self, name: str, slots: int):
+        self.slots = slots
+        size = self.SLOT.size * slots
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=name)
+        # el segmento lo comparten todos los workers: que ningún proceso lo borre al salir
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._buf = self._shm.buf
+        self._lock_fd = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_lock = threading.Lock()
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+        return h or 1  # 0 marca slot vacío
+
+    def _find(self, h: int) -> tuple[int, float, float]:
+        start = h % self.slots
+        victim, victim_ts = start, math.inf
+        for i in range(self.PROBE):
+            idx = (start + i) % self.slots
+            kh, tokens, last = self.SLOT.unpack_from(self._buf, idx * self.SLOT.size)
+            if kh == h:
+                return idx, tokens, last
+            if kh == 0:
+                return idx, math.nan, 0.0
+            if last < victim_ts:
+                victim, victim_ts = idx, last
+        return victim, math.nan, 0.0
+
+    def acquire(self, buckets: list[Bucket], now: float) -> float:
+        with self._thread_lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                found = []
+                wait = 0.0
+                for b in buckets:
+                    h = self._hash(b.key)
+                    idx, tokens, last = self._find(h)
+                    tokens = float(b.capacity) if math.isnan(tokens) else _refill(tokens, last, b, now)
+                    found.append((idx, h, tokens))
+                    if tokens < 1.0:
+                        wait = max(wait, _retry_after(tokens, b))
+                if wait:
+                    return wait
+                for idx, h, tokens in found:
+                    self.SLOT.pack_into(self._buf, idx * self.SLOT.size, h, tokens - 1.0, now)
+                return 0.0
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+
+def _per_minute(key: str, limit: int) -> Optional[Bucket]:
+    if limit <= 0:
+        return None
+    return Bucket(key, limit, limit / 60.0)
+
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+        self.rejected = 0
+
+    def buckets_for(self, path: str, ip: Optional[str], email: Optional[str]) -> list[Bucket]:
+        ip = ip or "-"
+        out = [_per_minute(f"ip:{path}:{ip}", settings.RATE_LIMIT_IP_PER_MINUTE)]
+        if email:
+            email = email.strip().lower()
+            out.append(_per_minute(f"email:{path}:{email}", settings.RATE_LIMIT_EMAIL_PER_MINUTE))
+            out.append(_per_minute(f"ipemail:{path}:{ip}:{email}", settings.RATE_LIMIT_IP_EMAIL_PER_MINUTE))
+        return [b for b in out if b is not None]
+
+    def check(self, path: str, ip: Optional[str], email: Optional[str]) -> float:
+        buckets = self.buckets_for(path, ip, email)
+        if not buckets:
+            return 0.0
+        wait = self.backend.acquire(buckets, time.time())
+        if wait:
+            self.rejected += 1
+        return wait
+
+
+def build_backend() -> RateLimitBackend:
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return MemoryBackend()
+    return SharedMemoryBackend(settings.RATE_LIMIT_SHM_NAME, settings.RATE_LIMIT_SHM_SLOTS)
+
+
+RATE_LIMITED_PATHS = ("/auth/login", "/auth/register", "/auth/refresh")
+# solo en estos se lee el body para limitar también por email; el resto va solo por IP
+EMAIL_KEYED_PATHS = ("/auth/login",)
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI: en login lee el body (para el email), decide y lo re-entrega intacto al handler."""
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None, paths=RATE_LIMITED_PATHS,
+                 email_paths=EMAIL_KEYED_PATHS, max_body_bytes: Optional[int] = None):
+        self.app = app
+        self.limiter = limiter
+        self.paths = set(paths)
+        self.email_paths = set(email_paths)
+        self.max_body_bytes = settings.RATE_LIMIT_MAX_BODY_BYTES if max_body_bytes is None else max_body_bytes
+
+    async def _read_body(self, receive) -> tuple[list, Optional[bytes]]:
+        """Lee el body completo; devuelve (mensajes, body) o (mensajes, None) si pasa `max_body_bytes`."""
+        messages = []
+        body = b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                return messages, body
+            body += message.get("body", b"")
+            if len(body) > self.max_body_bytes:
+                return messages, None
+            if not message.get("more_body", False):
+                return messages, body
+
+    def _declared_too_large(self, scope) -> bool:
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                try:
+                    return int(value) > self.max_body_bytes
+                except ValueError:
+                    return False
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        if self.limiter is None:
+            self.limiter = RateLimiter(build_backend())
+
+        messages = []
+        email = None
+        if scope["path"] in self.email_paths:
+            # un login legítimo es diminuto; uno inflado (relleno, campos extra) no puede saltarse
+            # los buckets por email, así que se rechaza antes de llegar al handler
+            body = None
+            if not self._declared_too_large(scope):
+                messages, body = await self._read_body(receive)
+            if body is None:
+                response = JSONResponse({"detail": "Body demasiado grande"}, status_code=413)
+                await response(scope, receive, send)
+                return
+            try:
+                data = json.loads(body) if body else None
+                if isinstance(data, dict) and isinstance(data.get("email"), str):
+                    email = data["email"]
+            except ValueError:
+                pass
+        client = scope.get("client")
+        wait = self.limiter.check(scope["path"], client[0] if client else None, email)
+        if wait:
+            response = JSONResponse(
+                {"detail": "Demasiadas solicitudes, intenta más tarde"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+            await response(scope, receive, send)
+            return
+
+        if not messages:
+            await self.app(scope, receive, send)
+            return
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        await self.app(scope, replay, send)
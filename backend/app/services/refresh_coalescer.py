@@ -0,0 +1,98 @@
+"""
+Coalescencia de `/auth/refresh` concurrentes sobre la misma sesión.
+
+Varias pestañas con la misma sesión suelen refrescar casi a la vez con el mismo token.
+Sin coordinación, la primera rota el hash y las demás fallan (o peor, se ven como
+reutilización y revocan la familia). Aquí, dentro de un worker:
+- single-flight: los pedidos con el mismo (sesión, token) esperan la rotación en curso
+  y reciben su resultado, sin repetir verificación ni escritura;
+- ventana de gracia: durante `REFRESH_GRACE_SECONDS` el token recién rotado devuelve el
+  par que ya se emitió.
+Entre workers, `crud.rotate_refresh` rota con compare-and-swap (solo gana uno) y distingue
+el mismo caso por `rotado_en`: responde 409 en vez de revocar (ver `crud.RefreshConflict`).
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from .config import settings
+from .crud import RefreshConflict
+from .security import refresh_token_digest
+
+
+class RefreshCoalescer:
+    def __init__(self, grace_seconds: float, max_entries: int):
+        self.grace_seconds = grace_seconds
+        self.max_entries = max_entries
+        self._inflight: dict[tuple[str, bytes], asyncio.Future] = {}
+        # huella del token rotado -> (sesión, par emitido, válido hasta)
+        self._recent: "OrderedDict[bytes, tuple[str, tuple[str, str], float]]" = OrderedDict()
+        self.coalesced = 0
+        self.grace_hits = 0
+
+    def _recent_get(self, fingerprint: bytes, session_id: str):
+        entry = self._recent.get(fingerprint)
+        if entry is None:
+            return None
+        sid, pair, until = entry
+        if sid != session_id or time.monotonic() > until:
+            return None
+        return pair
+
+    def _remember(self, fingerprint: bytes, session_id: str, pair: tuple[str, str]):
+        if self.grace_seconds <= 0:
+            return
+        self._recent[fingerprint] = (session_id, pair, time.monotonic() + self.grace_seconds)
+        self._recent.move_to_end(fingerprint)
+        now = time.monotonic()
+        while self._recent:
+            oldest = next(iter(self._recent))
+            if len(self._recent) > self.max_entries or self._recent[oldest][2] < now:
+                del self._recent[oldest]
+            else:
+                break
+
+    async def run(self, session_id: str, refresh_token: str, rotate: Callable[[], Awaitable[tuple[str, str]]]) -> tuple[str, str]:
+        """Ejecuta `rotate()` una vez por (sesión, token); devuelve (access, refresh)."""
+        fingerprint = refresh_token_digest(refresh_token)
+        pair = self._recent_get(fingerprint, session_id)
+        if pair is not None:
+            self.grace_hits += 1
+            return pair
+
+        key = (session_id, fingerprint)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        # si nadie más esperaba, que una excepción no quede "never retrieved"
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            pair = await rotate()
+        except asyncio.CancelledError:
+            # el cliente del request líder se desconectó: los que esperaban deben reintentar
+            future.set_exception(RefreshConflict("Refresh interrumpido; reintente"))
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self._remember(fingerprint, session_id, pair)
+            future.set_result(pair)
+            return pair
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {"inflight": len(self._inflight), "recent": len(self._recent),
+                "coalesced": self.coalesced, "grace_hits": self.grace_hits}
+
+
+refresh_coalescer = RefreshCoalescer(
+    grace_seconds=settings.REFRESH_GRACE_SECONDS,
+    max_entries=settings.SESSION_CACHE_MAX_ENTRIES or 10000,
+)
@@ -0,0 +1,126 @@
+"""
+Lista de revocación de access tokens para el modo sin estado (`AUTH_STATELESS`).
+
+En ese modo `get_current_user` confía en la firma y el `exp` del JWT y, en vez de leer la
+fila `sesion`, consulta esta lista:
+- por sesión: `revoke_session(sid)` (logout, revocación explícita);
+- por usuario: `revoke_user(uid, keep_sid)` invalida todo token del usuario emitido hasta
+  ese momento salvo el de `keep_sid` (login que reemplaza sesiones previas, cambio de estado).
+
+Cada entrada vive solo lo que dura un access token (`ACCESS_TOKEN_EXPIRE_MINUTES`): pasado
+eso, cualquier token afectado ya expiró solo. La tabla está en memoria compartida POSIX
+(igual que el rate limiter), así todos los workers de uvicorn ven las mismas revocaciones.
+"""
+import fcntl
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+from .config import settings
+
+
+def _hash(key: str) -> int:
+    h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return h or 1  # 0 marca slot vacío
+
+
+class RevocationList:
+    """
+    Tabla hash de direccionamiento abierto en memoria compartida, como la del rate limiter.
+    Cada slot: (hash de la clave u64, expira f64, revocado desde f64, hash de la sesión a
+    conservar u64). Si la ventana de sondeo está llena de entradas vigentes se pisa la que
+    expira antes (y se cuenta en `evicted_live`).
+    """
+
+    SLOT = struct.Struct("<QddQ")
+    PROBE = 16
+
+    def __init__(self, name: str, slots: int, ttl_seconds: float):
+        self.slots = slots
+        self.ttl = ttl_seconds
+        size = self.SLOT.size * slots
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=name)
+        # el segmento lo comparten todos los workers: que ningún proceso lo borre al salir
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._buf = self._shm.buf
+        self._lock_fd = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_lock = threading.Lock()
+        self.evicted_live = 0
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._thread_lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _lookup(self, h: int, now: float) -> Optional[tuple[float, int]]:
+        start = h % self.slots
+        for i in range(self.PROBE):
+            kh, expires, since, keep = self.SLOT.unpack_from(self._buf, ((start + i) % self.slots) * self.SLOT.size)
+            if kh == 0:
+                return None
+            if kh == h and expires > now:
+                return since, keep
+        return None
+
+    def _store(self, h: int, since: float, keep: int, now: float):
+        start = h % self.slots
+        target, target_exp = None, float("inf")
+        for i in range(self.PROBE):
+            idx = (start + i) % self.slots
+            kh, expires, _, _ = self.SLOT.unpack_from(self._buf, idx * self.SLOT.size)
+            if kh == h or kh == 0 or expires <= now:
+                target = idx
+                break
+            if expires < target_exp:
+                target, target_exp = idx, expires
+        else:
+            # ventana llena de entradas vigentes: se pisa la que expira antes
+            self.evicted_live += 1
+        self.SLOT.pack_into(self._buf, target * self.SLOT.size, h, now + self.ttl, since, keep)
+
+    def revoke_session(self, session_id: str):
+        now = time.time()
+        with self._locked(exclusive=True):
+            self._store(_hash("s:" + session_id), now, 0, now)
+
+    def revoke_user(self, usuario_id: int, keep_session_id: Optional[str] = None):
+        now = time.time()
+        keep = _hash("s:" + keep_session_id) if keep_session_id else 0
+        with self._locked(exclusive=True):
+            self._store(_hash(f"u:{int(usuario_id)}"), now, keep, now)
+
+    def is_revoked(self, session_id: str, usuario_id: int, issued_at: float) -> bool:
+        now = time.time()
+        with self._locked(exclusive=False):
+            if self._lookup(_hash("s:" + session_id), now) is not None:
+                return True
+            user = self._lookup(_hash(f"u:{int(usuario_id)}"), now)
+        if user is None:
+            return False
+        since, keep = user
+        # iat tiene resolución de segundos: un token del mismo segundo que la revocación
+        # se considera afectado salvo que sea de la sesión conservada
+        return issued_at <= since and keep != _hash("s:" + session_id)
+
+    def stats(self) -> dict:
+        return {"slots": self.slots, "ttl_seconds": self.ttl, "evicted_live": self.evicted_live}
+
+
+revocation_list = RevocationList(
+    name=settings.REVOCATION_SHM_NAME,
+    slots=settings.REVOCATION_SLOTS,
+    ttl_seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
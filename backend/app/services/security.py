@@ -1,11 +1,19 @@
+import os
+import math
+import time
+import asyncio
 import secrets
 import hashlib
+import hmac
 import base64
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple
 import jwt
 from passlib.context import CryptContext
 from .config import settings
+from .keyring import keyring
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -47,29 +55,168 @@ def verify_password(password: str, password_hash: bytes) -> bool:
         print(f"[ERROR] verify_password - Exception: {type(e).__name__}: {e}")
         raise
 
+# ----------- Refresh tokens -----------
+# Los refresh tokens ya traen 384 bits de entropía, así que no necesitan un hash lento:
+# se guardan como HMAC-SHA256 con clave del servidor. Los hashes bcrypt antiguos se
+# siguen aceptando y desaparecen solos en la siguiente rotación.
+
+REFRESH_DIGEST_PREFIX = b"hmac-sha256$"
+
+def _refresh_key() -> bytes:
+    key = settings.REFRESH_TOKEN_KEY or settings.SECRET_KEY
+    # separación de dominio respecto a la firma de JWT
+    return hashlib.sha256(b"refresh-token:" + key.encode("utf-8")).digest()
+
+def refresh_token_digest(token: str) -> bytes:
+    """Digest HMAC-SHA256 crudo (32 bytes) del refresh token."""
+    return hmac.new(_refresh_key(), token.encode("utf-8"), hashlib.sha256).digest()
+
+def is_legacy_refresh_hash(token_hash: bytes) -> bool:
+    return not token_hash.startswith(REFRESH_DIGEST_PREFIX)
+
 def hash_refresh_token(token: str) -> bytes:
-    """Hashea un refresh token usando SHA-256 + bcrypt."""
-    print(f"[DEBUG] hash_refresh_token - Token length: {len(token)}")
-    try:
-        normalized = _normalize_password(token)  # Reutilizamos la misma función
-        hashed = pwd_context.hash(normalized).encode()
-        print(f"[DEBUG] hash_refresh_token - Success! Hash length: {len(hashed)}")
-        return hashed
-    except Exception as e:
-        print(f"[ERROR] hash_refresh_token - Exception: {type(e).__name__}: {e}")
-        raise
+    """Calcula el valor a guardar en `sesion.refresh_hash` (HMAC-SHA256 en hex con prefijo)."""
+    return REFRESH_DIGEST_PREFIX + refresh_token_digest(token).hex().encode("ascii")
+
+def _verify_legacy_refresh_token(token: str, token_hash: bytes) -> bool:
+    """Verifica un refresh token contra un hash SHA-256 + bcrypt (formato anterior)."""
+    normalized = _normalize_password(token)  # Reutilizamos la misma función
+    return pwd_context.verify(normalized, token_hash.decode())
 
 def verify_refresh_token(token: str, token_hash: bytes) -> bool:
-    """Verifica un refresh token contra su hash."""
-    print(f"[DEBUG] verify_refresh_token - Starting")
+    """Verifica un refresh token contra su digest (comparación en tiempo constante)."""
+    if is_legacy_refresh_hash(token_hash):
+        return _verify_legacy_refresh_token(token, token_hash)
+    return hmac.compare_digest(hash_refresh_token(token), token_hash)
+
+# ----------- Pool de hashing -----------
+
+_hash_executor: Optional[Executor] = None
+
+def _hash_pool_workers() -> int:
+    return settings.HASH_POOL_WORKERS or os.cpu_count() or 1
+
+def _hash_pool_context():
+    # el pool nace cuando ya corren hilos (audit writer, bus, janitor...): un fork heredaría
+    # locks tomados por ellos (p. ej. el de stdout) y el worker podría colgarse
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def get_hash_executor() -> Executor:
+    """
+    Devuelve (y crea la primera vez) el pool donde corre bcrypt.
+    Así el trabajo de CPU no ocupa el threadpool de Starlette ni el event loop.
+    """
+    global _hash_executor
+    if _hash_executor is None:
+        workers = _hash_pool_workers()
+        if settings.HASH_POOL_KIND == "thread":
+            _hash_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        else:
+            _hash_executor = ProcessPoolExecutor(max_workers=workers, mp_context=_hash_pool_context())
+    return _hash_executor
+
+def shutdown_hash_executor():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True, cancel_futures=True)
+        _hash_executor = None
+
+class HashingOverloaded(Exception):
+    """El pool de hashing superó su presupuesto; el endpoint debe responder 503 + Retry-After."""
+    def __init__(self, retry_after: float):
+        super().__init__("Servicio de autenticación saturado")
+        self.retry_after = retry_after
+
+class HashAdmission:
+    """
+    Control de admisión del pool de hashing (load shedding).
+
+    Lleva el trabajo en vuelo y un promedio móvil (EWMA) de la espera en cola. Rechaza de
+    inmediato si hay `max_in_flight` tareas en vuelo, o si la espera media supera
+    `max_wait_ms` mientras todos los workers están ocupados. Así la latencia p99 queda
+    acotada en lugar de crecer sin límite. Corre en el event loop: no necesita locks.
+    """
+    def __init__(self, workers: int, max_in_flight: int, max_wait_ms: float):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.max_wait_ms = max_wait_ms
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.ewma_wait_ms = 0.0
+
+    def _retry_after(self) -> float:
+        return max(1.0, math.ceil(self.ewma_wait_ms / 1000.0))
+
+    def admit(self):
+        over_depth = self.in_flight >= self.max_in_flight
+        over_wait = self.in_flight >= self.workers and self.ewma_wait_ms > self.max_wait_ms
+        if over_depth or over_wait:
+            self.shed += 1
+            raise HashingOverloaded(self._retry_after())
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self, wait_ms: Optional[float]):
+        self.in_flight -= 1
+        if wait_ms is not None:
+            self.ewma_wait_ms = 0.8 * self.ewma_wait_ms + 0.2 * wait_ms
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "max_in_flight": self.max_in_flight,
+            "ewma_wait_ms": round(self.ewma_wait_ms, 2),
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+hash_admission = HashAdmission(
+    workers=_hash_pool_workers(),
+    max_in_flight=settings.HASH_MAX_IN_FLIGHT or _hash_pool_workers() * 4,
+    max_wait_ms=settings.HASH_MAX_QUEUE_WAIT_MS,
+)
+
+def _timed_call(fn, submitted_at: float, *args):
+    # corre en el worker del pool: devuelve la espera en cola junto al resultado
+    wait_ms = (time.time() - submitted_at) * 1000.0
+    return wait_ms, fn(*args)
+
+def _release_on_done(future: asyncio.Future):
+    # el cupo se libera cuando el pool termina la tarea, no cuando el request se cancela:
+    # un cliente que se desconecta no deja de ocupar el worker
+    wait_ms = None
+    if not future.cancelled() and future.exception() is None:
+        wait_ms = future.result()[0]
+    hash_admission.release(wait_ms)
+
+async def _run_hashing(fn, *args):
+    hash_admission.admit()
+    loop = asyncio.get_running_loop()
     try:
-        normalized = _normalize_password(token)  # Reutilizamos la misma función
-        result = pwd_context.verify(normalized, token_hash.decode())
-        print(f"[DEBUG] verify_refresh_token - Result: {result}")
-        return result
-    except Exception as e:
-        print(f"[ERROR] verify_refresh_token - Exception: {type(e).__name__}: {e}")
+        future = loop.run_in_executor(get_hash_executor(), _timed_call, fn, time.time(), *args)
+    except BaseException:
+        hash_admission.release(None)
         raise
+    future.add_done_callback(_release_on_done)
+    # shield: cancelar el request no cancela el future, así el callback corre al terminar el worker
+    wait_ms, result = await asyncio.shield(future)
+    return result
+
+async def hash_password_async(password: str) -> bytes:
+    return await _run_hashing(hash_password, password)
+
+async def verify_password_async(password: str, password_hash: bytes) -> bool:
+    return await _run_hashing(verify_password, password, password_hash)
+
+async def verify_refresh_token_async(token: str, token_hash: bytes) -> bool:
+    # solo los hashes bcrypt heredados van al pool
+    if is_legacy_refresh_hash(token_hash):
+        return await _run_hashing(_verify_legacy_refresh_token, token, token_hash)
+    return verify_refresh_token(token, token_hash)
 
 def create_access_token(subject: str, session_id: str, expires_minutes: int = None) -> str:
     if expires_minutes is None:
@@ -81,11 +228,27 @@ def create_access_token(subject: str, session_id: str, expires_minutes: int = No
         "iat": int(now.timestamp()),
         "exp": int((now + timedelta(minutes=expires_minutes)).timestamp()),
     }
-    token = jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
-    return token
+    if keyring is None:
+        return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    key = keyring.signing_key()
+    return jwt.encode(payload, key.private_key, algorithm=settings.JWT_ALGORITHM, headers={"kid": key.kid})
+
+def current_kid() -> Optional[str]:
+    """kid con el que se firman ahora los access tokens (None con HS256)."""
+    return keyring.signing_key().kid if keyring is not None else None
+
+def decode_access_token(token: str) -> dict:
+    """Verifica firma y exp. Con key ring, la clave pública sale del cache por `kid`."""
+    if keyring is None:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = keyring.verification_key(kid) if kid else None
+    if key is None:
+        raise jwt.InvalidKeyError("kid desconocido")
+    return jwt.decode(token, key, algorithms=[settings.JWT_ALGORITHM])
 
 def generate_refresh_token() -> str:
-    # 256 bits approx
+    # 384 bits (48 bytes)
     return secrets.token_urlsafe(48)
 
 def access_expiry_dt() -> datetime:
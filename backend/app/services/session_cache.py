@@ -0,0 +1,119 @@
+"""
+Cache en proceso de la validez de sesiones para `get_current_user`.
+
+Guarda, por id de sesión, lo necesario para autorizar un request sin ir a MySQL:
+usuario dueño, `expira_en`, `estado` del usuario y los campos de perfil que expone `/me`.
+Es un LRU acotado con TTL; `crud` lo invalida explícitamente al revocar sesiones o
+cambiar el estado de un usuario, y el TTL acota lo que puede quedar obsoleto.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from .config import settings
+
+# columnas de Usuario que se copian al cache (suficientes para UsuarioOut)
+USER_FIELDS = ("id", "cliente_id", "nombres", "apellidos", "email", "telefono", "estado",
+               "email_verificado", "telefono_verificado", "created_at", "updated_at")
+
+
+@dataclass(frozen=True)
+class CachedSession:
+    session_id: str
+    usuario_id: int
+    expira_en: datetime
+    estado: str
+    usuario: dict
+    cached_at: float
+
+
+class SessionCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, CachedSession]" = OrderedDict()
+        self._by_user: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, session_id: str) -> Optional[CachedSession]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - entry.cached_at > self.ttl_seconds:
+                self._drop(session_id)
+                self.misses += 1
+                return None
+            self._data.move_to_end(session_id)
+            self.hits += 1
+            return entry
+
+    def put(self, sesion, usuario) -> Optional[CachedSession]:
+        """Guarda la sesión (ORM `Sesion`) y su usuario (ORM `Usuario`) ya validados."""
+        return self.put_user(sesion.id, usuario, sesion.expira_en)
+
+    def put_user(self, session_id: str, usuario, expira_en: datetime) -> Optional[CachedSession]:
+        """Como `put`, sin fila de sesión (modo sin estado: `expira_en` sale del `exp` del token)."""
+        if not self.enabled:
+            return None
+        entry = CachedSession(
+            session_id=session_id,
+            usuario_id=int(usuario.id),
+            expira_en=expira_en,
+            estado=usuario.estado,
+            usuario={f: getattr(usuario, f) for f in USER_FIELDS},
+            cached_at=time.monotonic(),
+        )
+        with self._lock:
+            self._drop(entry.session_id)
+            self._data[entry.session_id] = entry
+            self._by_user.setdefault(entry.usuario_id, set()).add(entry.session_id)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+        return entry
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._drop(session_id)
+
+    def invalidate_user(self, usuario_id: int):
+        with self._lock:
+            for sid in list(self._by_user.get(int(usuario_id), ())):
+                self._drop(sid)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_user.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _drop(self, session_id: str):
+        entry = self._data.pop(session_id, None)
+        if entry is None:
+            return
+        sids = self._by_user.get(entry.usuario_id)
+        if sids is not None:
+            sids.discard(session_id)
+            if not sids:
+                del self._by_user[entry.usuario_id]
+
+
+session_cache = SessionCache(
+    max_entries=settings.SESSION_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.SESSION_CACHE_TTL_SECONDS,
+)
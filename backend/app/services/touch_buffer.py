@@ -0,0 +1,114 @@
+"""
+Write-behind de `sesion.ultimo_mov`.
+
+`get_current_user` ya no hace UPDATE + COMMIT por request: anota el toque aquí y un hilo
+de fondo los agrupa por sesión y los escribe en un único UPDATE masivo, cada
+`SESSION_TOUCH_FLUSH_INTERVAL_SECONDS` o al superar `SESSION_TOUCH_MAX_PENDING`.
+La precisión de la actividad se controla con `SESSION_TOUCH_GRANULARITY_SECONDS`:
+toques más cercanos que eso al último registrado se descartan.
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import update, case
+
+from .config import settings
+from .database import SessionLocal
+from ..models import models
+
+
+class TouchBuffer:
+    def __init__(self, granularity_seconds: int, flush_interval_seconds: float, max_pending: int):
+        self.granularity = timedelta(seconds=granularity_seconds)
+        self.flush_interval = flush_interval_seconds
+        self.max_pending = max_pending
+        self._pending: dict[str, datetime] = {}
+        # último valor aceptado por sesión, para aplicar la granularidad
+        self._last: dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def touch(self, session_id: str, when: datetime):
+        with self._lock:
+            last = self._last.get(session_id)
+            if last is not None and when - last < self.granularity:
+                return
+            self._last[session_id] = when
+            self._pending[session_id] = when
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def forget(self, session_id: str):
+        """Descarta lo pendiente de una sesión (p.ej. al revocarla)."""
+        with self._lock:
+            self._pending.pop(session_id, None)
+            self._last.pop(session_id, None)
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            # lo que ya no puede filtrar toques se libera para que _last no crezca sin límite
+            if batch:
+                horizon = max(batch.values()) - self.granularity
+                self._last = {sid: ts for sid, ts in self._last.items() if ts > horizon}
+        if not batch:
+            return 0
+        stmt = (
+            update(models.Sesion)
+            .where(models.Sesion.id.in_(list(batch)))
+            .values(ultimo_mov=case(batch, value=models.Sesion.id, else_=models.Sesion.ultimo_mov))
+            .execution_options(synchronize_session=False)
+        )
+        db = SessionLocal()
+        try:
+            db.execute(stmt)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[ERROR] TouchBuffer.flush - {type(e).__name__}: {e}")
+            # se reencola sin pisar toques más nuevos
+            with self._lock:
+                for sid, ts in batch.items():
+                    if sid not in self._pending:
+                        self._pending[sid] = ts
+            return 0
+        finally:
+            db.close()
+        self.flushes += 1
+        self.rows_written += len(batch)
+        return len(batch)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-touch-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo y vacía lo pendiente (llamar en shutdown)."""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+touch_buffer = TouchBuffer(
+    granularity_seconds=settings.SESSION_TOUCH_GRANULARITY_SECONDS,
+    flush_interval_seconds=settings.SESSION_TOUCH_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.SESSION_TOUCH_MAX_PENDING,
+)
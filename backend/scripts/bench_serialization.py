@@ -0,0 +1,65 @@
+"""
+Compara el costo de serializar las respuestas de auth/perfil:
+- ruta por defecto de FastAPI: validar contra response_model + jsonable_encoder + json.dumps
+- ruta rápida: trusted_dump + FastJSONResponse (orjson)
+
+Uso (desde la raíz del repo):
+    python -m backend.scripts.bench_serialization [iteraciones]
+
+No necesita base de datos: usa objetos en memoria con la misma forma que las entidades.
+"""
+import json
+import sys
+import timeit
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+from backend.app.models import schemas
+from backend.app.services import fast_json
+from backend.app.services.fast_json import FastJSONResponse, trusted_dump, trusted_dump_many
+
+
+def _default_path(schema, obj):
+    validated = schema.model_validate(obj)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def _default_path_many(schema, objs):
+    validated = [schema.model_validate(o) for o in objs]
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    token_pair = {
+        "access_token": "eyJhbGciOiJIUzI1NiJ9." + "a" * 160 + ".sig",
+        "refresh_token": "r" * 64,
+        "session_id": "20260101000000000abcdefgh",
+        "token_type": "bearer",
+    }
+    usuario = SimpleNamespace(id=42, nombres="Ana", apellidos="Pérez", email="ana@example.com", estado="activo")
+    clientes = [SimpleNamespace(id=i, nombre=f"Cliente {i}", identificador=f"c{i}", estado="activo") for i in range(100)]
+
+    cases = [
+        ("/auth/login, /auth/refresh (TokenPair)",
+         lambda: _default_path(schemas.TokenPair, token_pair),
+         lambda: FastJSONResponse(trusted_dump(schemas.TokenPair, token_pair)).body),
+        ("/me (UsuarioOut)",
+         lambda: _default_path(schemas.UsuarioOut, usuario),
+         lambda: fast_json.dumps(trusted_dump(schemas.UsuarioOut, usuario))),
+        ("/clientes (100 x ClienteOut)",
+         lambda: _default_path_many(schemas.ClienteOut, clientes),
+         lambda: fast_json.dumps(trusted_dump_many(schemas.ClienteOut, clientes))),
+    ]
+
+    print(f"encoder rápido: {'orjson' if fast_json.orjson is not None else 'json (orjson no instalado)'}; {n} iteraciones")
+    for name, default, fast in cases:
+        t_default = timeit.timeit(default, number=n) / n * 1e6
+        t_fast = timeit.timeit(fast, number=n) / n * 1e6
+        print(f"{name:45s} default {t_default:8.2f} us   rápido {t_fast:8.2f} us   x{t_default / t_fast:5.1f}")
+
+
+if __name__ == '__main__':
+    main()
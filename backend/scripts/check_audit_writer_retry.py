@@ -0,0 +1,64 @@
+"""
+Comprueba que el escritor de auditoría reintenta un lote cuyo INSERT falló una vez, en vez
+de descartarlo.
+
+Uso (desde la raíz del repo; no necesita MySQL):
+    python -m backend.scripts.check_audit_writer_retry
+
+Usa una fábrica de sesiones cuyo primer commit falla (como una caída breve de la BD) y
+exige que el lote completo quede escrito al reintento, sin filas en `failed`.
+"""
+import asyncio
+
+from backend.app.services.audit_writer import AuditWriter
+
+ROWS = 25
+
+
+class _FlakySession:
+    commits = 0
+    inserted: list = []
+
+    def __init__(self):
+        self._pending = []
+
+    def execute(self, stmt):
+        self._pending.append(stmt)
+
+    def commit(self):
+        type(self).commits += 1
+        if type(self).commits == 1:
+            raise ConnectionError("Lost connection to MySQL server during query")
+        type(self).inserted.extend(self._pending)
+
+    def rollback(self):
+        self._pending.clear()
+
+    def close(self):
+        pass
+
+
+async def run():
+    writer = AuditWriter(
+        max_queue=ROWS, batch_size=ROWS, flush_interval_seconds=0.1, enqueue_timeout_seconds=0.1,
+        lag_warning_seconds=5.0, write_retries=2, retry_backoff_seconds=0.01, session_factory=_FlakySession,
+    )
+    for i in range(ROWS):
+        await writer.submit("acceso_log", {"usuario_id": None, "email_intentado": f"retry-{i}@example.com", "exito": False})
+    writer.stop()  # sin hilo en marcha: vacía la cola en línea
+
+    stats = writer.stats()
+    print("stats:", stats, "commits:", _FlakySession.commits)
+    assert stats["written"] == ROWS, f"escritas {stats['written']} de {ROWS}"
+    assert stats["failed"] == 0, f"{stats['failed']} filas perdidas"
+    assert stats["retried"] == 1, f"{stats['retried']} reintentos, se esperaba 1"
+    assert len(_FlakySession.inserted) == 1, "el lote debe insertarse una sola vez"
+    print("OK")
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
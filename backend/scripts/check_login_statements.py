@@ -0,0 +1,133 @@
+"""
+Cuenta sentencias SQL y commits de un login exitoso contra la BD configurada.
+
+Uso (desde la raíz del repo, con MySQL levantado):
+    python -m backend.scripts.check_login_statements
+
+Crea un usuario de prueba si no existe y hace login en tres estados de `usuario_bloqueo`:
+sin fila, con intentos fallidos previos (se limpian) y con un bloqueo ya vencido (se levanta
+y se registra "autodesbloqueo"). Falla si alguno supera el presupuesto.
+"""
+import asyncio
+from datetime import timedelta
+
+from sqlalchemy import event, select, delete, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from backend.app.models import models
+from backend.app.services import auth_service, crud, security
+from backend.app.services.database import AsyncSessionLocal, async_engine
+
+EMAIL = "login-statements+test@example.com"
+PASSWORD = "secret123"
+
+# SELECT credenciales, UPDATE bloqueo (uno o dos, solo si hay estado), UPDATE sesiones,
+# INSERT sesión, más acceso_log y bloqueo_evento en línea (sin el escritor de auditoría en marcha).
+# El peor caso es 6: intentos previos (2 UPDATE de bloqueo) o bloqueo vencido (1 UPDATE + bloqueo_evento).
+MAX_STATEMENTS = 6
+MAX_COMMITS = 1
+
+
+async def _clear_lockout(usuario_id: int):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(models.UsuarioBloqueo).where(models.UsuarioBloqueo.usuario_id == usuario_id))
+        await db.commit()
+
+
+async def _prior_failures(usuario_id: int):
+    await _clear_lockout(usuario_id)
+    async with AsyncSessionLocal() as db:
+        await crud.register_failed_attempt(db, usuario_id)
+
+
+async def _expired_lock(usuario_id: int):
+    now = crud._utcnow()
+    t = models.UsuarioBloqueo.__table__
+    values = dict(intentos_fallidos=4, bloqueado_hasta=now - timedelta(minutes=1), ultimo_intento=now, updated_at=now)
+    async with AsyncSessionLocal() as db:
+        await db.execute(mysql_insert(t).values(usuario_id=usuario_id, **values).on_duplicate_key_update(**values))
+        await db.commit()
+
+
+async def _lockout_state(usuario_id: int) -> tuple:
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(models.UsuarioBloqueo.intentos_fallidos, models.UsuarioBloqueo.bloqueado_hasta)
+            .where(models.UsuarioBloqueo.usuario_id == usuario_id)
+        )).one_or_none()
+        unlocks = (await db.execute(
+            select(func.count()).select_from(models.BloqueoEvento)
+            .where(models.BloqueoEvento.usuario_id == usuario_id, models.BloqueoEvento.tipo == "autodesbloqueo")
+        )).scalar_one()
+    return row, unlocks
+
+
+async def _count_login() -> tuple[list[str], int]:
+    statements = []
+    commits = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+
+    def on_commit(conn):
+        commits.append(1)
+
+    sync_engine = async_engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", on_execute)
+    event.listen(sync_engine, "commit", on_commit)
+    try:
+        async with AsyncSessionLocal() as db:
+            await auth_service.login(db, email=EMAIL, password=PASSWORD, ip="127.0.0.1", user_agent="check-login-statements")
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", on_execute)
+        event.remove(sync_engine, "commit", on_commit)
+    return statements, len(commits)
+
+
+async def run():
+    async with AsyncSessionLocal() as db:
+        user = await crud.get_user_by_email(db, EMAIL)
+        if not user:
+            user = await crud.register_user_with_auto_client(db, nombres="Login", apellidos="Statements", email=EMAIL, telefono=None, password=PASSWORD)
+        usuario_id = user.id
+
+    # (nombre, preparación, UPDATEs esperados sobre usuario_bloqueo, autodesbloqueos esperados)
+    scenarios = [
+        ("sin estado de bloqueo", _clear_lockout, 0, 0),
+        ("intentos fallidos previos", _prior_failures, 2, 0),
+        ("bloqueo vencido", _expired_lock, 1, 1),
+    ]
+    failures = []
+    try:
+        for name, setup, lockout_updates, unlock_events in scenarios:
+            await setup(usuario_id)
+            _, unlocks_before = await _lockout_state(usuario_id)
+            statements, commits = await _count_login()
+            state, unlocks_after = await _lockout_state(usuario_id)
+
+            print(f"{name}: sentencias {len(statements)} {statements}, commits {commits}")
+            if len(statements) > MAX_STATEMENTS:
+                failures.append(f"{name}: {len(statements)} sentencias > {MAX_STATEMENTS}")
+            if commits > MAX_COMMITS:
+                failures.append(f"{name}: {commits} commits > {MAX_COMMITS}")
+            # UPDATE de sesiones previas + los del reset de bloqueo
+            if statements.count("UPDATE") != 1 + lockout_updates:
+                failures.append(f"{name}: {statements.count('UPDATE')} UPDATE, se esperaban {1 + lockout_updates}")
+            if state is not None and (state[0] != 0 or state[1] is not None):
+                failures.append(f"{name}: usuario_bloqueo quedó en {tuple(state)}")
+            if unlocks_after - unlocks_before != unlock_events:
+                failures.append(f"{name}: {unlocks_after - unlocks_before} autodesbloqueo, se esperaba {unlock_events}")
+    finally:
+        security.shutdown_hash_executor()
+        await async_engine.dispose()
+
+    assert not failures, "\n".join(failures)
+    print("OK")
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
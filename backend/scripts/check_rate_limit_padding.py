@@ -0,0 +1,84 @@
+"""
+Comprueba que un body de login inflado no esquiva los buckets por email del rate limiter.
+
+Uso (desde la raíz del repo; no necesita MySQL):
+    python -m backend.scripts.check_rate_limit_padding
+
+Manda logins al mismo email desde IPs distintas (así el bucket por IP nunca corta):
+- con relleno (espacios y un campo extra) por debajo del tope: deben agotar el bucket por
+  email y recibir 429;
+- por encima de `RATE_LIMIT_MAX_BODY_BYTES`: deben recibir 413 sin llegar al handler.
+"""
+import asyncio
+import json
+
+from backend.app.services.config import settings
+from backend.app.services.rate_limit import MemoryBackend, RateLimiter, RateLimitMiddleware
+
+EMAIL = "padding+test@example.com"
+
+
+async def _handler(scope, receive, send):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            break
+    json.loads(body)  # el handler recibe el body intacto
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _post(middleware, body: bytes, ip: str, chunk: int = 1024) -> int:
+    scope = {
+        "type": "http", "method": "POST", "path": "/auth/login", "client": (ip, 1234),
+        "headers": [(b"content-type", b"application/json")],
+    }
+    parts = [body[i:i + chunk] for i in range(0, len(body), chunk)] or [b""]
+    messages = [{"type": "http.request", "body": p, "more_body": i < len(parts) - 1} for i, p in enumerate(parts)]
+    status = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await middleware(scope, receive, send)
+    return status[0]
+
+
+def _padded(size: int) -> bytes:
+    body = json.dumps({"email": EMAIL, "password": "x", "relleno": ""}).encode()
+    return body[:-3] + b'"' + b" " * max(0, size - len(body)) + b'"}'
+
+
+async def run():
+    middleware = RateLimitMiddleware(_handler, limiter=RateLimiter(MemoryBackend()))
+    limit = settings.RATE_LIMIT_EMAIL_PER_MINUTE
+    failures = []
+
+    small = _padded(settings.RATE_LIMIT_MAX_BODY_BYTES - 16)
+    statuses = [await _post(middleware, small, f"10.0.0.{i}") for i in range(limit + 1)]
+    print("con relleno bajo el tope:", statuses)
+    if statuses[:limit] != [200] * limit or statuses[limit] != 429:
+        failures.append(f"se esperaban {limit} x 200 y luego 429")
+
+    big = _padded(10 * 1024)
+    statuses = [await _post(middleware, big, f"10.0.1.{i}") for i in range(3)]
+    print("con relleno sobre el tope:", statuses)
+    if statuses != [413] * 3:
+        failures.append("se esperaba 413 para bodies sobre el tope")
+
+    assert not failures, "\n".join(failures)
+    print("OK")
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Prueba de estrés de la sesión única activa: N logins en paralelo para el mismo usuario.
+
+Uso (desde la raíz del repo, con MySQL levantado):
+    python -m backend.scripts.stress_concurrent_logins [n_logins] [rondas]
+
+Cada login usa su propia sesión de BD (como requests distintos). Falla si algún login
+termina en error o si al final el usuario no tiene exactamente una sesión activa.
+También ejercita `crud.create_session` con la misma concurrencia.
+"""
+import asyncio
+import sys
+import time
+
+from sqlalchemy import select, func
+
+from backend.app.models import models
+from backend.app.services import auth_service, crud, security
+from backend.app.services.database import AsyncSessionLocal, async_engine
+
+EMAIL = "concurrent-logins+test@example.com"
+PASSWORD = "secret123"
+
+
+async def _login(i: int):
+    async with AsyncSessionLocal() as db:
+        return await auth_service.login(db, email=EMAIL, password=PASSWORD, ip="127.0.0.1", user_agent=f"stress-{i}")
+
+
+async def _create_session(usuario_id: int, i: int):
+    async with AsyncSessionLocal() as db:
+        return await crud.create_session(db, usuario_id, "127.0.0.1", f"stress-create-{i}")
+
+
+async def _active_sessions(usuario_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(func.count()).select_from(models.Sesion)
+            .where(models.Sesion.usuario_id == usuario_id, models.Sesion.activa == 1)
+        )).scalar_one()
+
+
+async def _round(name: str, calls) -> list[str]:
+    started = time.perf_counter()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    errors = [f"{type(r).__name__}: {r}" for r in results if isinstance(r, BaseException)]
+    print(f"{name}: {len(results)} en {time.perf_counter() - started:.2f}s, errores: {len(errors)}")
+    return errors
+
+
+async def run(n: int, rounds: int):
+    async with AsyncSessionLocal() as db:
+        user = await crud.get_user_by_email(db, EMAIL)
+        if not user:
+            user = await crud.register_user_with_auto_client(db, nombres="Concurrent", apellidos="Logins", email=EMAIL, telefono=None, password=PASSWORD)
+        usuario_id = user.id
+
+    failures = []
+    try:
+        for r in range(rounds):
+            errors = await _round(f"ronda {r + 1} login", [_login(i) for i in range(n)])
+            errors += await _round(f"ronda {r + 1} create_session", [_create_session(usuario_id, i) for i in range(n)])
+            active = await _active_sessions(usuario_id)
+            print(f"  sesiones activas: {active}")
+            if errors:
+                failures.append(f"ronda {r + 1}: {errors[:3]}")
+            if active != 1:
+                failures.append(f"ronda {r + 1}: {active} sesiones activas")
+    finally:
+        security.shutdown_hash_executor()
+        await async_engine.dispose()
+
+    assert not failures, "\n".join(failures)
+    print("OK")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    asyncio.run(run(n, rounds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Prueba de concurrencia de la rotación de refresh: dos sesiones de BD (como dos workers, sin
+el coalescer de por medio) rotan a la vez el mismo token de la misma sesión.
+
+Uso (desde la raíz del repo, con MySQL levantado):
+    python -m backend.scripts.stress_concurrent_refresh [rondas]
+
+En cada ronda ambas cargan la sesión antes de que ninguna rote. Falla si no hay exactamente un
+ganador y un `RefreshConflict`, si el historial no tiene exactamente una fila para el token
+rotado, si la sesión quedó revocada o si el token del ganador no sirve para la ronda siguiente.
+"""
+import asyncio
+import sys
+
+from sqlalchemy import select, func
+
+from backend.app.models import models
+from backend.app.services import auth_service, crud, security
+from backend.app.services.database import AsyncSessionLocal, async_engine
+
+EMAIL = "concurrent-refresh+test@example.com"
+PASSWORD = "secret123"
+
+
+async def _race(session_id: str, token: str) -> list:
+    async with AsyncSessionLocal() as db1, AsyncSessionLocal() as db2:
+        # las dos leen el mismo hash y contador antes de que ninguna escriba
+        pairs = [(db, await db.get(models.Sesion, session_id)) for db in (db1, db2)]
+        return await asyncio.gather(*(crud.rotate_refresh(db, ses, token) for db, ses in pairs), return_exceptions=True)
+
+
+async def _history_rows(token: str) -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(func.count()).select_from(models.RefreshHistorial)
+            .where(models.RefreshHistorial.fingerprint == security.refresh_token_digest(token))
+        )).scalar_one()
+
+
+async def _session_alive(session_id: str) -> bool:
+    async with AsyncSessionLocal() as db:
+        ses = await db.get(models.Sesion, session_id)
+        return ses is not None and not ses.revocada and ses.cierre is None
+
+
+async def run(rounds: int):
+    async with AsyncSessionLocal() as db:
+        if not await crud.get_user_by_email(db, EMAIL):
+            await crud.register_user_with_auto_client(db, nombres="Concurrent", apellidos="Refresh", email=EMAIL, telefono=None, password=PASSWORD)
+    async with AsyncSessionLocal() as db:
+        tokens = await auth_service.login(db, email=EMAIL, password=PASSWORD, ip="127.0.0.1", user_agent="stress-refresh")
+    session_id, token = tokens["session_id"], tokens["refresh_token"]
+
+    failures = []
+    try:
+        for r in range(rounds):
+            results = await _race(session_id, token)
+            winners = [res for res in results if not isinstance(res, BaseException)]
+            conflicts = [res for res in results if isinstance(res, crud.RefreshConflict)]
+            others = [f"{type(res).__name__}: {res}" for res in results if isinstance(res, BaseException) and not isinstance(res, crud.RefreshConflict)]
+            history = await _history_rows(token)
+            print(f"ronda {r + 1}: ganadores {len(winners)}, conflictos {len(conflicts)}, historial {history}, otros {others}")
+            if len(winners) != 1 or len(conflicts) != 1:
+                failures.append(f"ronda {r + 1}: {len(winners)} ganadores, {len(conflicts)} conflictos, {others}")
+            if history != 1:
+                failures.append(f"ronda {r + 1}: {history} filas de historial para el token rotado")
+            if not await _session_alive(session_id):
+                failures.append(f"ronda {r + 1}: la sesión quedó revocada")
+                break
+            if not winners:
+                break
+            token = winners[0][1]
+    finally:
+        security.shutdown_hash_executor()
+        await async_engine.dispose()
+
+    assert not failures, "\n".join(failures)
+    print("OK")
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    asyncio.run(run(rounds))
+
+
+if __name__ == '__main__':
+    main()
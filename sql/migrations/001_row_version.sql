@@ -0,0 +1,11 @@
+-- ------------------------------------------------------------
+-- Versión de fila (ETag) en cliente y usuario
+-- Para bases creadas con una versión anterior de schema_mysql.sql
+-- ------------------------------------------------------------
+USE seguridaddb;
+
+ALTER TABLE cliente
+  ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+
+ALTER TABLE usuario
+  ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
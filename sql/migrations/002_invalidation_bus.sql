@@ -0,0 +1,14 @@
+-- ------------------------------------------------------------
+-- Tabla del bus de invalidación (INVALIDATION_TRANSPORT=mysql)
+-- ------------------------------------------------------------
+USE seguridaddb;
+
+CREATE TABLE IF NOT EXISTS invalidacion_evento (
+  id BIGINT PRIMARY KEY AUTO_INCREMENT,
+  origen VARCHAR(120) NOT NULL,
+  seq BIGINT NOT NULL,
+  tipo VARCHAR(32) NOT NULL,
+  clave VARCHAR(64) NOT NULL,
+  emitido_en DATETIME(6) NOT NULL,
+  KEY ix_invalidacion_evento_emitido_en (emitido_en)
+) ENGINE=InnoDB;
@@ -0,0 +1,12 @@
+-- ------------------------------------------------------------
+-- Familias de refresh tokens: huella indexada para detectar reutilización
+-- Las filas anteriores quedan con fingerprint NULL y se podan por rotado_en
+-- ------------------------------------------------------------
+USE seguridaddb;
+
+ALTER TABLE refresh_historial
+  ADD COLUMN fingerprint BINARY(32) NULL,
+  ADD COLUMN generacion INT NULL,
+  ADD COLUMN expira_en DATETIME NULL,
+  ADD KEY ix_refresh_historial_fingerprint (fingerprint),
+  ADD KEY ix_refresh_historial_expira_en (expira_en);
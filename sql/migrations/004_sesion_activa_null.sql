@@ -0,0 +1,11 @@
+-- ------------------------------------------------------------
+-- Sesión única activa: `activa` pasa a ser 1 / NULL
+-- Con 1 / 0, el UNIQUE (usuario_id, activa) permitía una sola sesión cerrada por usuario
+-- y la revocación de la siguiente chocaba contra la anterior.
+-- ------------------------------------------------------------
+USE seguridaddb;
+
+ALTER TABLE sesion
+  DROP INDEX uq_sesion_unica_activa,
+  MODIFY COLUMN activa TINYINT(1) AS (IF(cierre IS NULL AND revocada=0, 1, NULL)) STORED,
+  ADD UNIQUE KEY uq_sesion_unica_activa (usuario_id, activa);
@@ -0,0 +1,30 @@
+-- ------------------------------------------------------------
+-- acceso_log particionada por mes sobre `momento`
+-- Reescribe la tabla completa (ALTER con copia): correr en una ventana de mantenimiento.
+-- Lo anterior al mes en curso queda en p_hist; el archivador la exporta y la descarta
+-- cuando su límite quede fuera de ACCESO_LOG_RETENTION_MONTHS.
+-- ------------------------------------------------------------
+USE seguridaddb;
+
+-- el nombre de la FK es el autogenerado por MySQL en schema_mysql.sql
+ALTER TABLE acceso_log DROP FOREIGN KEY acceso_log_ibfk_1;
+
+ALTER TABLE acceso_log
+  DROP PRIMARY KEY,
+  ADD PRIMARY KEY (id, momento),
+  RENAME INDEX usuario_id TO ix_acceso_log_usuario_id;  -- el índice que había creado la FK
+
+-- límites calculados desde la fecha actual: mes en curso + ACCESO_LOG_PARTITIONS_AHEAD (3)
+SET @m0 = DATE(DATE_FORMAT(CURDATE(), '%Y-%m-01'));
+SET @ddl = CONCAT(
+  'ALTER TABLE acceso_log PARTITION BY RANGE COLUMNS(momento) (',
+  'PARTITION p_hist VALUES LESS THAN (''', @m0, '''), ',
+  'PARTITION p', DATE_FORMAT(@m0, '%Y%m'), ' VALUES LESS THAN (''', @m0 + INTERVAL 1 MONTH, '''), ',
+  'PARTITION p', DATE_FORMAT(@m0 + INTERVAL 1 MONTH, '%Y%m'), ' VALUES LESS THAN (''', @m0 + INTERVAL 2 MONTH, '''), ',
+  'PARTITION p', DATE_FORMAT(@m0 + INTERVAL 2 MONTH, '%Y%m'), ' VALUES LESS THAN (''', @m0 + INTERVAL 3 MONTH, '''), ',
+  'PARTITION p', DATE_FORMAT(@m0 + INTERVAL 3 MONTH, '%Y%m'), ' VALUES LESS THAN (''', @m0 + INTERVAL 4 MONTH, '''), ',
+  'PARTITION pmax VALUES LESS THAN (MAXVALUE))'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
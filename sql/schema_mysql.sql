@@ -8,6 +8,7 @@ CREATE DATABASE IF NOT EXISTS seguridaddb
 USE seguridaddb;
 
 -- Limpieza (opcional en desarrollo)
+DROP TABLE IF EXISTS invalidacion_evento;
 DROP TABLE IF EXISTS refresh_historial;
 DROP TABLE IF EXISTS username_recovery_log;
 DROP TABLE IF EXISTS password_reset_token;
@@ -30,7 +31,9 @@ CREATE TABLE cliente (
   nombre        VARCHAR(150) NOT NULL,
   identificador VARCHAR(50),
   estado ENUM('activo','inactivo') DEFAULT 'activo',
-  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  -- versión de fila para ETag (se actualiza sola)
+  updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
 ) ENGINE=InnoDB;
 
 -- USUARIO
@@ -46,6 +49,7 @@ CREATE TABLE usuario (
   email_verificado   TINYINT(1) NOT NULL DEFAULT 0,
   telefono_verificado TINYINT(1) NOT NULL DEFAULT 0,
   created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
   UNIQUE KEY uq_usuario_email (email),
   CONSTRAINT fk_usuario_cliente FOREIGN KEY (cliente_id) REFERENCES cliente(id)
 ) ENGINE=InnoDB;
@@ -131,7 +135,8 @@ CREATE TABLE sesion (
   rotation_counter INT NOT NULL DEFAULT 0,
   kid VARCHAR(64) NULL,
 
-  activa TINYINT(1) AS (IF(cierre IS NULL AND revocada=0, 1, 0)) STORED,
+  -- NULL (no 0) para las cerradas: el UNIQUE admite muchas NULL y solo una activa=1 por usuario
+  activa TINYINT(1) AS (IF(cierre IS NULL AND revocada=0, 1, NULL)) STORED,
   FOREIGN KEY (usuario_id) REFERENCES usuario(id),
   UNIQUE KEY uq_sesion_unica_activa (usuario_id, activa)
 ) ENGINE=InnoDB;
@@ -142,21 +147,45 @@ CREATE TABLE refresh_historial (
   sesion_id CHAR(26) NOT NULL,
   prev_hash VARBINARY(255) NOT NULL,
   rotado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  fingerprint BINARY(32) NULL,     -- HMAC-SHA256 del token rotado (detección de reutilización)
+  generacion INT NULL,             -- rotation_counter de la sesión cuando se rotó
+  expira_en DATETIME NULL,         -- vencimiento del token rotado (poda)
+  KEY ix_refresh_historial_fingerprint (fingerprint),
+  KEY ix_refresh_historial_expira_en (expira_en),
   FOREIGN KEY (sesion_id) REFERENCES sesion(id)
 ) ENGINE=InnoDB;
 
 -- Log de accesos (éxitos/fallos)
+-- Particionada por mes: la PK incluye `momento` y no lleva FK (MySQL no las admite en
+-- tablas particionadas). Las particiones siguientes las crea log_retention (rollover) y las
+-- vencidas se exportan a .ndjson.gz antes de DROP PARTITION.
 CREATE TABLE acceso_log (
-  id BIGINT PRIMARY KEY AUTO_INCREMENT,
+  id BIGINT NOT NULL AUTO_INCREMENT,
   usuario_id BIGINT NULL,
   email_intentado VARCHAR(160) NULL,
   momento DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
   exito TINYINT(1) NOT NULL,
   ip VARCHAR(45) NULL,
   detalle VARCHAR(255) NULL,
-  FOREIGN KEY (usuario_id) REFERENCES usuario(id)
+  PRIMARY KEY (id, momento),
+  KEY ix_acceso_log_usuario_id (usuario_id)
 ) ENGINE=InnoDB;
 
+-- particiones desde el mes en curso (mismo bloque que sql/migrations/005)
+SET @m0 = DATE(DATE_FORMAT(CURDATE(), '%Y-%m-01'));
+SET @ddl = CONCAT(
+  'ALTER TABLE acceso_log PARTITION BY RANGE COLUMNS(momento) (',
+  'PARTITION p_hist VALUES LESS THAN (''', @m0, '''), ',
+  'PARTITION p', DATE_FORMAT(@m0, '%Y%m'), ' VALUES LESS THAN (''', @m0 + INTERVAL 1 MONTH, '''), ',
+  'PARTITION p', DATE_FORMAT(@m0 + INTERVAL 1 MONTH, '%Y%m'), ' VALUES LESS THAN (''', @m0 + INTERVAL 2 MONTH, '''), ',
+  'PARTITION p', DATE_FORMAT(@m0 + INTERVAL 2 MONTH, '%Y%m'), ' VALUES LESS THAN (''', @m0 + INTERVAL 3 MONTH, '''), ',
+  'PARTITION p', DATE_FORMAT(@m0 + INTERVAL 3 MONTH, '%Y%m'), ' VALUES LESS THAN (''', @m0 + INTERVAL 4 MONTH, '''), ',
+  'PARTITION pmax VALUES LESS THAN (MAXVALUE))'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
 -- Contador/bloqueo por intentos
 CREATE TABLE usuario_bloqueo (
   usuario_id BIGINT PRIMARY KEY,
@@ -198,5 +227,16 @@ CREATE TABLE username_recovery_log (
   enviado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB;
 
+-- Bus de invalidación entre workers (transporte "mysql")
+CREATE TABLE invalidacion_evento (
+  id BIGINT PRIMARY KEY AUTO_INCREMENT,
+  origen VARCHAR(120) NOT NULL,
+  seq BIGINT NOT NULL,
+  tipo VARCHAR(32) NOT NULL,
+  clave VARCHAR(64) NOT NULL,
+  emitido_en DATETIME(6) NOT NULL,
+  KEY ix_invalidacion_evento_emitido_en (emitido_en)
+) ENGINE=InnoDB;
+
 -- Seed mínimo
 INSERT INTO cliente (nombre, identificador, estado) VALUES ('Default', NULL, 'activo');